@@ -0,0 +1,117 @@
+#  Copyright (c) 2020 Industrial Technology Research Institute.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+import json
+import os
+import statistics
+import tempfile
+import time
+import tracemalloc
+import argparse
+from validator import Validator
+from workload import generate_workload, write_orders, write_schedule
+
+# name: (orders, days, lines)
+scales = {
+    'small': (30, 30, 3),
+    'medium': (300, 184, 4),
+    'large': (1000, 730, 6),
+}
+
+
+def _run(order_file, submit_file, start_date, end_date):
+    """One full validation, returning the time spent in each phase."""
+    t0 = time.perf_counter()
+    val = Validator(order_file, submit_file, start_date, end_date)
+    t1 = time.perf_counter()
+    val.validate_dates()
+    t2 = time.perf_counter()
+    val.check_valid_schedule()
+    t3 = time.perf_counter()
+    if not val.check_pass:
+        raise RuntimeError('Generated schedule is not valid: ' + val.check_msg)
+    return {'load': t1 - t0, 'validate_dates': t2 - t1, 'check_valid_schedule': t3 - t2, 'total': t3 - t0}
+
+
+def _peak_memory(order_file, submit_file, start_date, end_date):
+    """Peak traced memory in bytes of loading and of each validation phase."""
+    tracemalloc.start()
+    try:
+        val = Validator(order_file, submit_file, start_date, end_date)
+        peaks = {'load': tracemalloc.get_traced_memory()[1]}
+        tracemalloc.reset_peak()
+        val.validate_dates()
+        peaks['validate_dates'] = tracemalloc.get_traced_memory()[1]
+        tracemalloc.reset_peak()
+        val.check_valid_schedule()
+        peaks['check_valid_schedule'] = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return peaks
+
+
+def benchmark(n_orders, n_days, n_lines, repeat=5, seed=0):
+    """Time the validator on a generated workload.
+
+    The order file and submission are written to a temporary directory and
+    validated ``repeat`` times; phase times are medians. Peak memory is taken
+    from a separate traced run, since tracing slows the validator down.
+    """
+    orders, schedule, start_date, end_date = generate_workload(n_orders, n_days, n_lines, seed=seed)
+    items = sum(len(line_data) for lines in schedule.values() for line_data in lines.values())
+    with tempfile.TemporaryDirectory() as tmp:
+        order_file = os.path.join(tmp, 'orders.csv')
+        submit_file = os.path.join(tmp, 'submission.json')
+        write_orders(orders, order_file)
+        write_schedule(schedule, submit_file)
+
+        runs = [_run(order_file, submit_file, start_date, end_date) for _ in range(repeat)]
+        seconds = {phase: statistics.median(run[phase] for run in runs) for phase in runs[0]}
+        peaks = _peak_memory(order_file, submit_file, start_date, end_date)
+        submit_bytes = os.path.getsize(submit_file)
+
+    return {'orders': n_orders, 'days': n_days, 'lines': n_lines, 'items': items, 'submit_bytes': submit_bytes,
+            'seconds': seconds, 'validations_per_sec': 1 / seconds['total'],
+            'item_latency_us': seconds['check_valid_schedule'] / items * 1e6, 'peak_bytes': peaks}
+
+
+def print_report(results):
+    print('{:<8} {:>6} {:>5} {:>7} {:>9} {:>9} {:>9} {:>9} {:>8} {:>8} {:>9}'.format(
+        'scale', 'orders', 'days', 'items', 'load ms', 'dates ms', 'sched ms', 'val/s', 'us/item',
+        'dates MB', 'sched MB'))
+    for name, result in results.items():
+        seconds = result['seconds']
+        peaks = result['peak_bytes']
+        print('{:<8} {:>6} {:>5} {:>7} {:>9.1f} {:>9.2f} {:>9.1f} {:>9.2f} {:>8.2f} {:>8.2f} {:>9.2f}'.format(
+            name, result['orders'], result['days'], result['items'], seconds['load'] * 1e3,
+            seconds['validate_dates'] * 1e3, seconds['check_valid_schedule'] * 1e3, result['validations_per_sec'],
+            result['item_latency_us'], peaks['validate_dates'] / 2 ** 20, peaks['check_valid_schedule'] / 2 ** 20))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser("benchmark")
+    parser.add_argument("--scales", default=','.join(scales), type=str,
+                        help="comma separated scales from {}".format(', '.join(scales)))
+    parser.add_argument("--repeat", default=5, type=int)
+    parser.add_argument("--seed", default=0, type=int)
+    parser.add_argument("--output", default=None, type=str, help="also write the results to this JSON file")
+    args = parser.parse_args()
+
+    results = {}
+    for name in args.scales.split(','):
+        results[name] = benchmark(*scales[name], repeat=args.repeat, seed=args.seed)
+    print_report(results)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
@@ -0,0 +1,44 @@
+#  Copyright (c) 2020 Industrial Technology Research Institute.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+import datetime
+from order_table import date_ordinal
+
+
+class CalendarIndex:
+    """Integer day ordinals of the scheduling horizon.
+
+    Every 'YYYY-MM-DD' string from start_date to end_date is mapped to its day
+    ordinal once, so date checks are dict lookups instead of strptime calls.
+    The ordinals are the same ones OrderTable uses for not_before/not_after.
+    """
+
+    def __init__(self, start_date, end_date):
+        self.start = date_ordinal(start_date)
+        self.end = date_ordinal(end_date)
+        self.days = {datetime.date.fromordinal(day).strftime('%Y-%m-%d'): day
+                     for day in range(self.start, self.end + 1)}
+
+    def ordinal(self, date):
+        """Day ordinal of a date string; raises ValueError for a malformed date."""
+        day = self.days.get(date)
+        if day is None:
+            day = date_ordinal(date)
+        return day
+
+    def __contains__(self, day):
+        return self.start <= day <= self.end
+
+    def __len__(self):
+        return len(self.days)
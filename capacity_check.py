@@ -0,0 +1,234 @@
+#  Copyright (c) 2020 Industrial Technology Research Institute.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+import datetime
+import argparse
+import numpy as np
+from order_table import OrderTable, date_ordinal
+from plant_model import PlantModel, default_plant
+from query_table import special_order_code
+from validator import Violation, handle_validation_errors
+
+# Line sets checked for capacity are unions of the line sets of the orders, up to this many.
+max_line_sets = 64
+
+
+def _date(day):
+    return datetime.date.fromordinal(int(day)).strftime('%Y-%m-%d')
+
+
+def _line_names(plant, mask):
+    return ', '.join(line_no for line_no in plant.lines if plant.line_bit[line_no] & mask)
+
+
+def order_line_mask(orders, row, plant):
+    """Bitmask of the lines an order can be produced on under checks 6 and 7.
+
+    A line qualifies if the material and product code allow it, the plant has
+    a width limit for the line and the order type, the order width is within
+    it, and the largest allowed mfg_width leaves the width margin of the type.
+    """
+    product_code = orders.product_code[row]
+    if not isinstance(product_code, str):
+        return 0
+    product_mask = plant.product_lines.get(product_code, plant.all_lines if product_code in special_order_code else 0)
+    mask = plant.material_lines.get(orders.material[row], plant.all_lines) & product_mask
+    product_type = orders.type[row]
+    width = orders.width[row]
+    margin = plant.width_margin.get(product_type)
+    for line_no, line_bit in plant.line_bit.items():
+        if not mask & line_bit:
+            continue
+        limits = plant.width_limits.get((line_no, product_type))
+        try:
+            fits = limits is not None and limits[0] >= 0 and not width > limits[1] and \
+                (margin is None or not (limits[0] - width) < margin)
+        except Exception:
+            fits = False
+        if not fits:
+            mask &= ~line_bit
+    return mask
+
+
+def _order_hours(quantity):
+    """Production hours of a quantity (125 per hour), or None if no whole number of hours makes it."""
+    if isinstance(quantity, bool) or not isinstance(quantity, (int, float)):
+        return None
+    if not quantity >= 0 or quantity % 125:
+        return None
+    return int(quantity // 125)
+
+
+def _line_sets(masks):
+    line_sets = set()
+    for mask in sorted(set(masks)):
+        line_sets |= {mask | line_set for line_set in line_sets} | {mask}
+        if len(line_sets) > max_line_sets:
+            break
+    return sorted(line_sets)
+
+
+def screen_orders(orders, start_date, end_date, plant=None):
+    """Find orders that no schedule from start_date to end_date can complete.
+
+    Works on the order table and plant alone. Every order must be producible
+    on some line within its date window (clipped to the horizon) in a whole
+    number of hours. Then, for every set of lines, the orders that can only
+    run on those lines and whose windows lie inside an interval of days
+    must fit into the line-hours of that interval: 24 per day per line, with
+    no more lines than the plant may open on a day. Tune time is not
+    counted, so a schedule the screen rejects cannot pass the full checks.
+
+    Returns a list of Violation, the tightest interval of each overloaded
+    line set first.
+    """
+    plant = plant or default_plant()
+    first_day = date_ordinal(start_date)
+    last_day = date_ordinal(end_date)
+    violations = []
+    lows, highs, hours, masks = [], [], [], []
+    line_masks = {}
+    for row, order_code in enumerate(orders.codes):
+        if row in orders.date_errors:
+            violations.append(Violation('order_dates', orders.date_errors[row], None, None, order_code))
+            continue
+        low = max(orders.not_before[row], first_day)
+        high = min(orders.not_after[row], last_day)
+        if low > high:
+            msg = 'Order {}: no day between not_before and not_after from {} to {}.'.format(
+                order_code, start_date, end_date)
+            violations.append(Violation('order_window', msg, None, None, order_code))
+            continue
+        order_hours = _order_hours(orders.quantity[row])
+        if order_hours is None:
+            msg = 'Order {}: quantity {} is not a whole number of hours (125 per hour).'.format(
+                order_code, orders.quantity[row])
+            violations.append(Violation('order_quantity', msg, None, None, order_code))
+            continue
+        key = (orders.product_code[row], orders.material[row], orders.type[row], orders.width[row])
+        mask = line_masks.get(key)
+        if mask is None:
+            mask = line_masks[key] = order_line_mask(orders, row, plant)
+        if not mask:
+            msg = 'Order {}: no production line allows its material, product code, type and width.'.format(
+                order_code)
+            violations.append(Violation('order_lines', msg, None, None, order_code))
+            continue
+        lows.append(low)
+        highs.append(high)
+        hours.append(order_hours)
+        masks.append(mask)
+
+    lows = np.array(lows, dtype=np.int64)
+    highs = np.array(highs, dtype=np.int64)
+    hours = np.array(hours, dtype=np.int64)
+    order_masks = np.array(masks, dtype=np.int64)
+    max_open = plant.open_lines[-1] if plant.open_lines else 0
+    overloads = []
+    for line_set in _line_sets(masks):
+        selected = (order_masks & ~line_set) == 0
+        # Candidate intervals run from a window start (latest first) to a window end (earliest first).
+        starts = np.unique(lows[selected])[::-1]
+        ends = np.unique(highs[selected])
+        excess = np.zeros((len(starts), len(ends)), dtype=np.int64)
+        np.add.at(excess, (len(starts) - 1 - np.searchsorted(starts[::-1], lows[selected]),
+                           np.searchsorted(ends, highs[selected])), hours[selected])
+        # Hours of the orders whose windows lie within starts[i]..ends[j], less the line-hours of those days.
+        np.cumsum(excess, axis=0, out=excess)
+        np.cumsum(excess, axis=1, out=excess)
+        demand = excess.copy()
+        rate = 24 * min(bin(line_set).count('1'), max_open)
+        excess -= rate * ends[None, :]
+        excess += rate * (starts - 1)[:, None]
+        # No window lies within an empty interval, so only cells with demand are intervals.
+        excess[demand == 0] = 0
+        i, j = np.unravel_index(np.argmax(excess), excess.shape)
+        if excess[i, j] > 0:
+            overloads.append((-excess[i, j], line_set, starts[i], ends[j], demand[i, j], demand[i, j] - excess[i, j]))
+    for _, line_set, start, end, demand, capacity in sorted(overloads):
+        msg = 'Orders due from {} to {} that only lines {} can produce need {:g} hours; ' \
+              'at most {:g} line-hours are available.'.format(_date(start), _date(end), _line_names(plant, line_set),
+                                                             demand, capacity)
+        violations.append(Violation('capacity', msg, None, None, None))
+    return violations
+
+
+def screen_schedule(orders, schedule):
+    """Find the hour totals of a submission that make it fail.
+
+    These are line-days that are not 24 hours and orders scheduled for more or
+    fewer hours than their quantity. It only sums hours, so it is much cheaper than the full checks. A schedule
+    with malformed days, lines or items is left to the full checks and gets
+    no violations here.
+    """
+    violations = []
+    scheduled = [0] * len(orders.codes)
+    for date, lines in schedule.items():
+        if not isinstance(lines, dict):
+            return []
+        for line_no, items in lines.items():
+            if not isinstance(items, list):
+                return []
+            line_hours = 0
+            for item in items:
+                if not isinstance(item, dict) or not isinstance(item.get('hours'), int) or item['hours'] < 0:
+                    return []
+                line_hours += item['hours']
+                row = orders.index.get(item.get('order_code')) if isinstance(item.get('order_code'), str) else None
+                if row is not None:
+                    scheduled[row] += item['hours']
+            if line_hours != 24:
+                msg = '{}, {}: {} hours scheduled, a line-day has 24.'.format(date, line_no, line_hours)
+                violations.append(Violation('line_day_hours', msg, date, line_no, None))
+    for row, order_code in enumerate(orders.codes):
+        if scheduled[row] * 125 != orders.quantity[row]:
+            msg = 'Order {}: {} hours scheduled, quantity {} needs {}.'.format(
+                order_code, scheduled[row], orders.quantity[row], _order_hours(orders.quantity[row]))
+            violations.append(Violation('scheduled_hours', msg, None, None, order_code))
+    return violations
+
+
+def prescreen(val):
+    """Capacity pre-screen of a Validator, run before ``validate_dates`` and ``check_valid_schedule``.
+
+    Records the violations of ``screen_orders`` and, if the order book can be
+    completed, of ``screen_schedule``. The full checks only need to run if
+    ``val.check_pass`` is still True afterwards.
+    """
+    if not val.can_check():
+        return val.check_pass, val.check_msg
+    violations = screen_orders(val.orders, val.start_date, val.end_date, val.plant)
+    if not violations:
+        violations = screen_schedule(val.orders, val.data)
+    for violation in violations:
+        handle_validation_errors(val, violation.msg, violation.rule, violation.date, violation.line_no,
+                                 violation.order_code)
+        if val.stop_checking():
+            break
+    return val.check_pass, val.check_msg
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser("capacity_check")
+    parser.add_argument("--order_file", default='orders_2019.csv', type=str)
+    parser.add_argument("--start_date", default='2019-07-01', type=str)
+    parser.add_argument("--end_date", default='2019-12-31', type=str)
+    parser.add_argument("--plant", default=None, type=str, help="plant model file (see plant_model.py)")
+    args = parser.parse_args()
+    plant = PlantModel.load(args.plant) if args.plant else None
+    found = screen_orders(OrderTable.from_csv(args.order_file), args.start_date, args.end_date, plant)
+    for violation in found:
+        print('[{}] {}'.format(violation.rule, violation.msg))
+    if not found:
+        print('Order book fits the capacity of the plant.')
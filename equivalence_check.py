@@ -0,0 +1,489 @@
+#  Copyright (c) 2020 Industrial Technology Research Institute.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+import copy
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import argparse
+from workload import generate_workload, write_orders, write_schedule
+
+# Run in a directory holding the validator.py and query_table.py of the reference revision. They are
+# reloaded for every case, as the first validator kept the line states of a run in query_table.
+_reference_script = '''
+import importlib, json, sys
+import query_table, validator
+results = {}
+for case, start_date, end_date in json.load(open(sys.argv[1])):
+    importlib.reload(query_table)
+    importlib.reload(validator)
+    prefix = '{}/{}'.format(sys.argv[2], case)
+    try:
+        val = validator.Validator(prefix + '.csv', prefix + '.json', start_date, end_date)
+        val.validate_dates()
+        val.check_valid_schedule()
+        results[case] = [val.check_pass, val.check_msg]
+    except Exception as e:
+        results[case] = [None, type(e).__name__]
+json.dump(results, sys.stdout)
+'''
+
+
+def generate_case(seed, n_days, active, start_date='2019-07-01'):
+    """A random order book and a valid schedule for it, from workload.generate_workload.
+
+    ``active`` lines produce between one order and one order per 60 hours
+    each, split at random cut points, and every day lists its lines in
+    random order. Returns ``(orders, schedule, start_date, end_date)``.
+    """
+    rng = random.Random(seed)
+    n_orders = active * rng.randint(1, n_days * 24 // 60)
+    return generate_workload(n_orders, n_days, active, start_date, rng.getrandbits(32), random_hours=True,
+                             shuffle_lines=True)
+
+
+def _item_positions(schedule):
+    return [(date, line_no, position) for date, lines in schedule.items() if isinstance(lines, dict)
+            for line_no, items in lines.items() if isinstance(items, list) for position in range(len(items))]
+
+
+def mutate_case(rng, orders, schedule):
+    """Break one rule (or format) of a generated case in place."""
+    kind = rng.randrange(26)
+    dates = list(schedule)
+    positions = _item_positions(schedule)
+    date, line_no, position = rng.choice(positions)
+    item = schedule[date][line_no][position]
+
+    def items_with(predicate):
+        return [p for p in positions if predicate(schedule[p[0]][p[1]][p[2]]['order_code'])]
+
+    if kind == 0:
+        item['hours'] += rng.choice([-3, -1, 1, 2])
+    elif kind == 1:
+        items = schedule[date][line_no]
+        if len(items) > 1:
+            i = rng.randrange(len(items) - 1)
+            items[i], items[i + 1] = items[i + 1], items[i]
+    elif kind == 2:
+        tunes = items_with(lambda code: code.startswith('tune'))
+        if tunes:
+            date, line_no, position = rng.choice(tunes)
+            schedule[date][line_no][position]['order_code'] = 'stop'
+            schedule[date][line_no][position]['product_code'] = 'stop'
+    elif kind == 3:
+        item['mfg_width'] += rng.choice([-60, -5, 10, 400])
+    elif kind == 4:
+        item['order_code'] = 'BOGUS'
+    elif kind == 5:
+        item['product_code'] = rng.choice(['N001', 'K008', 'stop', 'tune_8', 'X'])
+    elif kind == 6:
+        del item[rng.choice(list(item))]
+    elif kind == 7:
+        key = rng.choice(['hours', 'mfg_width', 'order_code', 'product_code'])
+        item[key] = rng.choice(['1', 1.5, None, 3])
+    elif kind == 8:
+        del schedule[date][line_no]
+    elif kind == 9:
+        del schedule[rng.choice(dates)]
+    elif kind == 10:
+        schedule['2020-01-05'] = copy.deepcopy(schedule[dates[0]])
+    elif kind == 11:
+        a, b = rng.sample(range(len(dates)), 2)
+        keys = list(schedule)
+        keys[a], keys[b] = keys[b], keys[a]
+        swapped = {key: schedule[key] for key in keys}
+        schedule.clear()
+        schedule.update(swapped)
+    elif kind == 12:
+        renamed = {key.replace('-', '/') if key == date else key: value for key, value in schedule.items()}
+        schedule.clear()
+        schedule.update(renamed)
+    elif kind == 13:
+        schedule[date]['Z9'] = schedule[date].pop(line_no)
+    elif kind == 14:
+        schedule[date][line_no] = rng.choice([[], {}, 'x'])
+    elif kind == 15:
+        stops = items_with(lambda code: code == 'stop')
+        reals = items_with(lambda code: code not in ('stop', 'tune_8', 'tune_48'))
+        if stops and reals:
+            s = rng.choice(stops)
+            r = rng.choice(reals)
+            schedule[s[0]][s[1]][s[2]] = dict(schedule[r[0]][r[1]][r[2]], hours=schedule[s[0]][s[1]][s[2]]['hours'])
+    elif kind == 16:
+        tunes = items_with(lambda code: code.startswith('tune'))
+        if tunes:
+            date, line_no, position = rng.choice(tunes)
+            tune = schedule[date][line_no][position]
+            tune['order_code'] = tune['product_code'] = rng.choice(['tune_8', 'tune_48'])
+            tune['hours'] = rng.choice([tune['hours'], 4, 8, 24, 30])
+    elif kind == 17:
+        item['hours'] = -item['hours']
+    elif kind == 18:
+        rng.choice(orders)['quantity'] += 125
+    elif kind == 19:
+        order = rng.choice(orders)
+        order['not_before'] = rng.choice(['2019-07-20T00:00:00', 'garbage', '2019-12-31'])
+    elif kind == 20:
+        order = rng.choice(orders)
+        order['type'] = 'lenti' if order['type'] == 'plate' else 'plate'
+    elif kind == 21:
+        order = rng.choice(orders)
+        order['composition'] = rng.choice(['0%', '8%', '100%', ''])
+    elif kind == 22:
+        order = rng.choice(orders)
+        order['width'] += rng.choice([10, 300])
+    elif kind == 23:
+        rng.choice(orders)['material'] = 'MS'
+    elif kind == 24:
+        orders.append(dict(orders[0], order_code='EXTRA'))
+    elif kind == 25:
+        for items in schedule[date].values():
+            if isinstance(items, list):
+                for stopped in items:
+                    stopped['order_code'] = stopped['product_code'] = 'stop'
+    return kind
+
+
+def write_cases(case_dir, n_cases, seed=1):
+    """Write ``n_cases`` cases (<n>.csv, <n>.json) to case_dir; returns ``[(n, start_date, end_date)]``.
+
+    About a quarter of the cases are valid; the rest have up to three mutations.
+    """
+    rng = random.Random(seed)
+    cases = []
+    for case in range(n_cases):
+        orders, schedule, start_date, end_date = generate_case(case, rng.choice([10, 20, 40]),
+                                                               rng.choice([2, 3, 4, 5]))
+        for _ in range(rng.choice([0, 1, 1, 1, 2, 3])):
+            mutate_case(rng, orders, schedule)
+        if not schedule:
+            schedule = {start_date: {}}
+        write_orders(orders, os.path.join(case_dir, '{}.csv'.format(case)))
+        write_schedule(schedule, os.path.join(case_dir, '{}.json'.format(case)))
+        cases.append((case, start_date, end_date))
+    with open(os.path.join(case_dir, 'cases.json'), 'w') as f:
+        json.dump(cases, f)
+    return cases
+
+
+def reference_results(case_dir, revision=None):
+    """First-violation verdicts of the validator at a git revision (the first commit by default).
+
+    Returns ``{case: [check_pass, check_msg]}``; a case the reference raised
+    on has ``[None, exception name]``. The reference validator needs pandas.
+    """
+    root = os.path.dirname(os.path.abspath(__file__))
+    if revision is None:
+        revision = subprocess.check_output(['git', 'rev-list', '--max-parents=0', 'HEAD'], cwd=root,
+                                           text=True).split()[0]
+    with tempfile.TemporaryDirectory() as reference_dir:
+        for name in ('validator.py', 'query_table.py'):
+            source = subprocess.check_output(['git', 'show', '{}:{}'.format(revision, name)], cwd=root)
+            with open(os.path.join(reference_dir, name), 'wb') as f:
+                f.write(source)
+        output = subprocess.check_output([sys.executable, '-c', _reference_script,
+                                          os.path.join(case_dir, 'cases.json'), case_dir], cwd=reference_dir)
+    return {int(case): result for case, result in json.loads(output).items()}
+
+
+def _validate(order_file, json_file, start_date, end_date, max_violations, vectorized=False):
+    from validator import Validator
+    from vector_check import check_valid_schedule_vectorized
+    val = Validator(order_file, json_file, start_date, end_date, max_violations)
+    val.validate_dates()
+    if vectorized:
+        check_valid_schedule_vectorized(val)
+    else:
+        val.check_valid_schedule()
+    return val
+
+
+class Comparison:
+    """Counts of one equivalence check, keeping the first few mismatches."""
+
+    def __init__(self, name):
+        self.name = name
+        self.compared = 0
+        self.skipped = 0
+        self.mismatches = []
+
+    def expect(self, case, expected, actual):
+        self.compared += 1
+        if expected != actual:
+            self.mismatches.append((case, expected, actual))
+
+    def report(self):
+        print('{}: {} compared, {} skipped, {} mismatched'.format(self.name, self.compared, self.skipped,
+                                                                  len(self.mismatches)))
+        for case, expected, actual in self.mismatches[:5]:
+            print('  case {}\n    expected {}\n    got      {}'.format(case, expected, actual))
+        return not self.mismatches
+
+
+def compare_first_violation(case_dir, cases, reference):
+    """The first violation (or valid verdict) matches the reference, also when collecting all violations.
+
+    Where the reference raised, the case must fail with a violation instead.
+    """
+    comparison = Comparison('first violation')
+    for case, start_date, end_date in cases:
+        prefix = os.path.join(case_dir, str(case))
+        first = _validate(prefix + '.csv', prefix + '.json', start_date, end_date, 1)
+        collected = _validate(prefix + '.csv', prefix + '.json', start_date, end_date, None)
+        collected_first = collected.violations[0].msg if collected.violations else collected.check_msg
+        expected = reference[case]
+        if expected[0] is None:
+            expected = [False, first.check_msg]
+        comparison.expect(case, expected, [first.check_pass, first.check_msg])
+        comparison.expect(case, first.check_msg, collected_first)
+    return comparison
+
+
+def compare_vectorized(case_dir, cases):
+    """check_valid_schedule_vectorized gives the verdict, violations and metrics of the sequential checks."""
+    comparison = Comparison('vectorized')
+    for case, start_date, end_date in cases:
+        prefix = os.path.join(case_dir, str(case))
+        for max_violations in (1, None):
+            sequential = _validate(prefix + '.csv', prefix + '.json', start_date, end_date, max_violations)
+            vectorized = _validate(prefix + '.csv', prefix + '.json', start_date, end_date, max_violations, True)
+            comparison.expect(case, (sequential.check_pass, sequential.check_msg, sequential.violations,
+                                     sequential.metrics),
+                              (vectorized.check_pass, vectorized.check_msg, vectorized.violations,
+                               vectorized.metrics))
+    return comparison
+
+
+def compare_binary_and_line_parallel(case_dir, cases, workers=2):
+    """Binary schedules and LineParallelValidator match the sequential checks of the JSON schedule.
+
+    Cases the binary layout cannot hold are only compared line-parallel as JSON.
+    """
+    from line_parallel import LineParallelValidator
+    from schedule_binary import write_binary_schedule
+    binary = Comparison('binary schedule')
+    parallel = Comparison('line-parallel')
+    for case, start_date, end_date in cases:
+        prefix = os.path.join(case_dir, str(case))
+        binary_file = prefix + '.sched'
+        try:
+            with open(prefix + '.json') as f:
+                write_binary_schedule(json.load(f), binary_file)
+        except (ValueError, AttributeError):
+            binary_file = None
+            binary.skipped += 1
+        with LineParallelValidator(prefix + '.csv', workers) as line_validator:
+            for max_violations in (1, None):
+                val = _validate(prefix + '.csv', prefix + '.json', start_date, end_date, max_violations)
+                expected = (val.check_pass, val.check_msg, val.violations, val.metrics)
+                result = line_validator.validate(prefix + '.json', start_date, end_date, max_violations)
+                parallel.expect(case, expected[:3], tuple(result[:3]))
+                if binary_file:
+                    val = _validate(prefix + '.csv', binary_file, start_date, end_date, max_violations)
+                    binary.expect(case, expected, (val.check_pass, val.check_msg, val.violations, val.metrics))
+                    result = line_validator.validate(binary_file, start_date, end_date, max_violations)
+                    parallel.expect(case, expected[:3], tuple(result[:3]))
+    return binary, parallel
+
+
+def compare_budgets(case_dir, cases):
+    """A max_violations of 0, below 0 or not an int is rejected by every entry point instead of passing.
+
+    The junk schedule below must fail, and does with no limit (None).
+    """
+    from schedule_stream import validate_stream
+    from validator import Validator, evaluate, validate_batch
+    comparison = Comparison('violation budget')
+    case, start_date, end_date = cases[0]
+    order_file = os.path.join(case_dir, '{}.csv'.format(case))
+    junk = {start_date: {'A1': 'junk'}}
+    junk_file = os.path.join(case_dir, 'junk.json')
+    with open(junk_file, 'w') as f:
+        json.dump(junk, f)
+    entry_points = {'Validator': lambda budget: Validator(order_file, junk, start_date, end_date, budget),
+                    'evaluate': lambda budget: evaluate(order_file, junk, start_date, end_date, budget),
+                    'validate_stream': lambda budget: validate_stream(order_file, junk_file, start_date, end_date,
+                                                                      budget),
+                    'validate_batch': lambda budget: list(validate_batch(order_file, [junk_file], start_date,
+                                                                         end_date, 1, budget))}
+    for name, entry_point in entry_points.items():
+        for budget in (0, -1, True, 1.5):
+            try:
+                entry_point(budget)
+                outcome = 'accepted'
+            except ValueError:
+                outcome = 'ValueError'
+            comparison.expect((name, budget), 'ValueError', outcome)
+    comparison.expect('evaluate None', False, evaluate(order_file, junk, start_date, end_date, None).check_pass)
+    return comparison
+
+
+def _same_values(expected, actual):
+    """Equal lists of equal types, where NaN equals NaN."""
+    return len(expected) == len(actual) and all(
+        type(a) is type(b) and (a == b or a != a and b != b) for a, b in zip(expected, actual))
+
+
+def compare_order_csv(case_dir, cases):
+    """OrderTable.from_csv reads order files like pandas.read_csv did, blank lines and empty files included.
+
+    Every case order file is also read with a blank line in the middle and at
+    the end (skipped by both), and an empty file must raise ValueError.
+    """
+    from order_table import OrderTable, order_columns
+    comparison = Comparison('order csv')
+    try:
+        import pandas as pd
+    except ImportError:
+        comparison.skipped += len(cases) + 1
+        return comparison
+    blank_file = os.path.join(case_dir, 'blank.csv')
+    for case, _, _ in cases:
+        order_file = os.path.join(case_dir, '{}.csv'.format(case))
+        with open(order_file) as f:
+            lines = f.readlines()
+        with open(blank_file, 'w') as f:
+            f.writelines(lines[:2] + ['\n'] + lines[2:] + ['\n'])
+        for path in (order_file, blank_file):
+            expected = OrderTable.from_dataframe(pd.read_csv(path, index_col='order_code'))
+            actual = OrderTable.from_csv(path)
+            comparison.expect(case, [True] * (len(order_columns) + 2),
+                              [_same_values(expected.codes, actual.codes)] +
+                              [_same_values(getattr(expected, name), getattr(actual, name))
+                               for name in order_columns] + [expected.date_errors == actual.date_errors])
+    empty_file = os.path.join(case_dir, 'empty.csv')
+    open(empty_file, 'w').close()
+    try:
+        OrderTable.from_csv(empty_file)
+        outcome = 'accepted'
+    except ValueError as e:
+        outcome = str(e)
+    comparison.expect('empty file', 'No columns to parse from file', outcome)
+    return comparison
+
+
+# Documents the stream must fail with a violation of this rule, at its first violation.
+stream_documents = [('{"2019-07-01": 5}', 'line_items'),
+                    ('{"2019-07-01": "A1"}', 'line_items'),
+                    ('{"2019-07-01": {"A1": [5]}}', 'item_keys'),
+                    ('{"2019-07-01": {"A1": "stop"}}', 'line_items'),
+                    ('{"2019/07/01": {}}', 'date_format'),
+                    ('{"2019-07-01": {"A1": [tru]}}', 'json_format'),
+                    ('[]', 'json_format'),
+                    ('', 'json_format')]
+
+
+def compare_stream(case_dir, cases):
+    """validate_stream gives the verdict of Validator, and fails the malformed stream_documents early.
+
+    The first violation is not compared: the stream reports violations in
+    file order rather than all date checks first.
+    """
+    from schedule_stream import validate_stream
+    comparison = Comparison('stream')
+    for case, start_date, end_date in cases:
+        prefix = os.path.join(case_dir, str(case))
+        val = _validate(prefix + '.csv', prefix + '.json', start_date, end_date, None)
+        for chunk_size in (7, 1 << 16):
+            result = validate_stream(prefix + '.csv', prefix + '.json', start_date, end_date, None, chunk_size)
+            comparison.expect(case, val.check_pass, result.check_pass)
+    case, start_date, end_date = cases[0]
+    document_file = os.path.join(case_dir, 'stream.json')
+    for document, rule in stream_documents:
+        with open(document_file, 'w') as f:
+            f.write(document)
+        result = validate_stream(os.path.join(case_dir, '{}.csv'.format(case)), document_file, start_date, end_date)
+        comparison.expect(document, rule, result.violations[0].rule if result.violations else None)
+    return comparison
+
+
+def compare_moves(n_schedules=20, n_moves=150, seed=5):
+    """MoveEvaluator.evaluate agrees with validating the changed schedule from scratch.
+
+    Random swaps and mfg_width changes are evaluated on generated valid
+    schedules; about half of the feasible ones are applied, and the evaluator
+    must then equal one built from the resulting schedule.
+    """
+    from move_evaluator import MoveEvaluator
+    from order_table import OrderTable
+    from validator import evaluate
+    rng = random.Random(seed)
+    comparison = Comparison('move evaluator')
+    with tempfile.TemporaryDirectory() as work_dir:
+        order_file = os.path.join(work_dir, 'orders.csv')
+        for case in range(n_schedules):
+            orders, schedule, start_date, end_date = generate_case(case, 60, rng.choice([3, 4, 5]))
+            write_orders(orders, order_file)
+            table = OrderTable.from_csv(order_file)
+            evaluator = MoveEvaluator(table, schedule, start_date, end_date)
+            dates = list(schedule)
+            for _ in range(n_moves):
+                kind = rng.randrange(3)
+                date_a = rng.choice(dates)
+                line_a = rng.choice(list(schedule[date_a]))
+                index_a = rng.randrange(len(schedule[date_a][line_a]))
+                if kind == 0:
+                    changes = evaluator.swap(date_a, line_a, index_a, date_a, line_a,
+                                             rng.randrange(len(schedule[date_a][line_a])))
+                elif kind == 1:
+                    date_b = rng.choice(dates)
+                    line_b = rng.choice(list(schedule[date_b]))
+                    changes = evaluator.swap(date_a, line_a, index_a, date_b, line_b,
+                                             rng.randrange(len(schedule[date_b][line_b])))
+                else:
+                    changes = evaluator.set_mfg_width(date_a, line_a, index_a,
+                                                      schedule[date_a][line_a][index_a]['mfg_width'] +
+                                                      rng.choice([0, 10, -10]))
+                violations = evaluator.evaluate(changes)
+                changed = copy.deepcopy(schedule)
+                for (date, line_no), items in changes.items():
+                    changed[date][line_no] = copy.deepcopy(items)
+                comparison.expect(case, evaluate(table, changed, start_date, end_date).check_pass, not violations)
+                if not violations and rng.random() < 0.5:
+                    comparison.expect(case, [], evaluator.apply(changes))
+                    schedule = evaluator.schedule
+            rebuilt = MoveEvaluator(table, copy.deepcopy(schedule), start_date, end_date)
+            comparison.expect(case, (rebuilt.open_count, rebuilt.checkpoints),
+                              (evaluator.open_count, evaluator.checkpoints))
+    return comparison
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser("equivalence_check")
+    parser.add_argument("--cases", default=600, type=int, help="number of generated cases")
+    parser.add_argument("--seed", default=1, type=int)
+    parser.add_argument("--reference", default=None, type=str,
+                        help="git revision of the reference validator (the first commit by default)")
+    parser.add_argument("--case_dir", default=None, type=str, help="write the cases here and keep them")
+    parser.add_argument("--line_workers", default=2, type=int, help="worker processes of the line-parallel checks")
+    parser.add_argument("--moves", default=150, type=int, help="moves per schedule for the move evaluator check")
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory() as temp_dir:
+        case_dir = args.case_dir or temp_dir
+        os.makedirs(case_dir, exist_ok=True)
+        cases = write_cases(case_dir, args.cases, args.seed)
+        reference = reference_results(case_dir, args.reference)
+        print('{} cases, {} valid in the reference.'.format(len(cases), sum(
+            1 for result in reference.values() if result[0] is True)))
+        comparisons = [compare_first_violation(case_dir, cases, reference), compare_vectorized(case_dir, cases),
+                       *compare_binary_and_line_parallel(case_dir, cases, args.line_workers),
+                       compare_stream(case_dir, cases), compare_budgets(case_dir, cases),
+                       compare_order_csv(case_dir, cases),
+                       compare_moves(n_moves=args.moves)]
+    passed = all([comparison.report() for comparison in comparisons])
+    sys.exit(0 if passed else 1)
@@ -0,0 +1,195 @@
+#  Copyright (c) 2020 Industrial Technology Research Institute.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import ExitStack, nullcontext
+from itertools import islice
+from order_table import OrderTable
+from plant_model import default_plant
+from validator import Validator, ScheduleState, Evaluation, Violation, handle_validation_errors
+
+_worker_orders = None
+_worker_plant = None
+
+
+def _init_line_worker(orders, plant):
+    global _worker_orders, _worker_plant
+    from shared_order_table import attach_orders
+    _worker_orders = attach_orders(orders)
+    _worker_plant = plant
+
+
+def check_line(orders, line_no, days, start_date, end_date, max_violations=1, plant=None):
+    """Run checks 3-8 on one production line over the whole horizon.
+
+    ``days`` lists ``(day, position, date, items)`` for every day the line is
+    scheduled, where ``position`` is the index of the line within that day.
+    Returns the partial result merged by LineParallelValidator: violations keyed
+    by schedule position, the days the line is open, the orders it produces with
+    their quantities and first position, and its hour metrics.
+    """
+    val = Validator(orders, {}, start_date, end_date, max_violations, plant=plant)
+    run = ScheduleState([line_no], val.calendar, val.plant)
+    violations = []
+    open_days = []
+    amounts = []
+    for day, position, date, items in days:
+        run.start_day(date)
+        count = len(val.violations)
+        order_count = len(run.amount_dict)
+        val.check_line_day(run, line_no, items)
+        for seq in range(count, len(val.violations)):
+            violations.append(((day, position, seq), val.violations[seq]))
+        if line_no in run.open_line_per_day:
+            open_days.append(day)
+        for rank, order in enumerate(islice(run.amount_dict, order_count, None)):
+            amounts.append(((day, position, rank), order))
+        if val.stop_checking():
+            break
+    amounts = [(key, order, run.amount_dict[order]) for key, order in amounts]
+    return {'line_no': line_no, 'violations': violations, 'open_days': open_days,
+            'order_set': run.order_set, 'amounts': amounts, 'metrics': run.metrics}
+
+
+def _check_line_worker(line_no, days, start_date, end_date, max_violations):
+    return check_line(_worker_orders, line_no, days, start_date, end_date, max_violations, _worker_plant)
+
+
+def _check_mapped_line_worker(binary_file, line_no, start_date, end_date, max_violations):
+    from schedule_binary import BinarySchedule
+    days = BinarySchedule(binary_file).line_schedule(line_no)
+    return check_line(_worker_orders, line_no, days, start_date, end_date, max_violations, _worker_plant)
+
+
+class LineParallelValidator:
+    """Validate the production lines of a schedule concurrently.
+
+    The transition rules (checks 3-8) only look at one line, so every line is
+    checked in its own worker process. The parent then reduces the partial
+    results: open flags per day for the open-line count (9), the line
+    coverage of every day, and the order sets and quantities (10-11).
+    Violations are ordered by their position in the schedule, so the verdict
+    and the first ``max_violations`` violations match a sequential Validator.
+
+    The order table is compiled once and sent to each worker when the pool
+    starts, or with ``shared_orders`` written once to a memory-mapped file the
+    workers attach to; use the validator as a context manager to shut the
+    pool down.
+    A binary schedule file is not sent at all: each worker maps the file and
+    decodes only the items of its own line.
+    """
+
+    def __init__(self, order_file, workers=None, plant=None, shared_orders=False):
+        self.orders = order_file if isinstance(order_file, OrderTable) else OrderTable.from_csv(order_file)
+        self.plant = plant or default_plant()
+        self.resources = ExitStack()
+        if shared_orders:
+            from shared_order_table import shared_order_file
+        worker_orders = self.resources.enter_context(
+            shared_order_file(self.orders) if shared_orders else nullcontext(self.orders))
+        self.pool = ProcessPoolExecutor(workers, initializer=_init_line_worker, initargs=(worker_orders, self.plant))
+
+    def validate(self, json_file, start_date, end_date, max_violations=1):
+        """Validate one submission (JSON or binary schedule path, or mapping) and return an Evaluation."""
+        plant = self.plant
+        val = Validator(self.orders, json_file, start_date, end_date, max_violations, plant=plant)
+        val.validate_dates()
+        if not val.can_check():
+            return Evaluation(val.check_pass, val.check_msg, val.violations, val.metrics)
+
+        dates = list(val.data)
+        mapped = hasattr(val.data, 'line_schedule')
+        day_lines = val.data.day_lines() if mapped else [list(lines) if isinstance(lines, dict) else None
+                                                         for lines in val.data.values()]
+        scheduled = set()
+        violations = []
+        for day, lines in enumerate(day_lines):
+            if lines is None:
+                msg = '{}: Scheduled production lines should be an object.'.format(dates[day])
+                violations.append(((day, 0, 0), Violation('line_items', msg, dates[day], None, None)))
+                continue
+            for position, line_no in enumerate(lines):
+                if line_no in plant.line_bit:
+                    scheduled.add(line_no)
+                else:
+                    msg = '{}, {}: Wrong production lines.'.format(dates[day], line_no)
+                    violations.append(((day, position, 0), Violation('line_name', msg, dates[day], line_no, None)))
+
+        if mapped:
+            futures = [self.pool.submit(_check_mapped_line_worker, val.data.path, line_no, start_date, end_date,
+                                        max_violations)
+                       for line_no in plant.lines if line_no in scheduled]
+        else:
+            line_days = {line_no: [] for line_no in scheduled}
+            for day, (date, lines) in enumerate(val.data.items()):
+                if day_lines[day] is None:
+                    continue
+                for position, (line_no, items) in enumerate(lines.items()):
+                    if line_no in line_days:
+                        line_days[line_no].append((day, position, date, items))
+            futures = [self.pool.submit(_check_line_worker, line_no, line_days[line_no], start_date, end_date,
+                                        max_violations)
+                       for line_no in plant.lines if line_no in scheduled]
+        partials = [future.result() for future in futures]
+
+        open_count = [0] * len(dates)
+        for partial in partials:
+            violations.extend(partial['violations'])
+            for day in partial['open_days']:
+                open_count[day] += 1
+            for name in ('tune_8_hours', 'tune_48_hours', 'stop_hours'):
+                val.metrics[name] += partial['metrics'][name]
+        val.metrics['open_line_days'] = sum(open_count)
+
+        #  9. Check if the number of opened production lines are between 2~6.
+        for day, date in enumerate(dates):
+            if day_lines[day] is None:
+                continue
+            after_lines = len(day_lines[day])
+            if set(day_lines[day]) != plant.line_set:
+                msg = 'Missing schedule for some production lines.'
+                violations.append(((day, after_lines, 0), Violation('line_missing', msg, date, None, None)))
+            if open_count[day] not in plant.open_lines:
+                msg = 'The number of open production lines should be between {} and {}.'.format(
+                    plant.open_lines[0], plant.open_lines[-1])
+                violations.append(((day, after_lines, 1), Violation('open_lines', msg, date, None, None)))
+
+        violations.sort(key=lambda item: item[0])
+        for _, violation in violations:
+            handle_validation_errors(val, violation.msg, violation.rule, violation.date, violation.line_no,
+                                     violation.order_code)
+            if val.stop_checking():
+                break
+
+        # 10-11. Reduce the order sets and quantities of all lines.
+        if not val.stop_checking():
+            run = ScheduleState(calendar=val.calendar, plant=plant)
+            amounts = sorted((amount for partial in partials for amount in partial['amounts']),
+                             key=lambda amount: amount[0])
+            for partial in partials:
+                run.order_set |= partial['order_set']
+            for _, order, amount in amounts:
+                run.amount_dict[order] = run.amount_dict.get(order, 0) + amount
+            val.check_orders(run)
+        return Evaluation(val.check_pass, val.check_msg, val.violations, val.metrics)
+
+    def close(self):
+        self.pool.shutdown()
+        self.resources.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,53 @@
+#  Copyright (c) 2020 Industrial Technology Research Institute.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+from plant_model import default_plant
+
+
+class LineState:
+    """Transition state of one production line.
+
+    Only the values the tune rules look back at are kept, so the state stays
+    the same size however long the schedule is:
+
+    * last_code: order code of the previous scheduled item (None before the first one)
+    * last_type: type of the previous order, starting from the initial state of the line
+    * last_composition: composition of the previous order
+    * last_mfg_width: mfg_width of the previous order
+    * tune_hours: hours tuned since the previous order
+    """
+
+    __slots__ = ('last_code', 'last_type', 'last_composition', 'last_mfg_width', 'tune_hours')
+
+    def __init__(self, initial_type):
+        self.last_code = None
+        self.last_type = initial_type
+        self.last_composition = None
+        self.last_mfg_width = None
+        self.tune_hours = 0
+
+    def copy(self):
+        other = LineState.__new__(LineState)
+        for name in self.__slots__:
+            setattr(other, name, getattr(self, name))
+        return other
+
+    def __eq__(self, other):
+        return all(getattr(self, name) == getattr(other, name) for name in self.__slots__)
+
+
+def new_line_states(lines=None, plant=None):
+    """Create fresh line states for a validation run (every line of the plant by default)."""
+    plant = plant or default_plant()
+    return {line_no: LineState(plant.initial_state[line_no]) for line_no in (lines or plant.lines)}
@@ -0,0 +1,153 @@
+#  Copyright (c) 2020 Industrial Technology Research Institute.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+from validator import Validator, ScheduleState, Violation
+
+
+class MoveEvaluator:
+    """Incremental feasibility checks for local-search moves on a valid schedule.
+
+    For every production line the LineState entering each day is kept as a
+    prefix checkpoint. A move is described as ``changes``, a dict mapping
+    ``(date, line_no)`` to the new list of items for that line-day. Only the
+    touched lines are re-checked, starting at their first changed day and
+    stopping as soon as the line state matches the stored checkpoint again
+    after the last changed day, so a typical move costs a day or two of items.
+
+    Re-checked line-days go through the same checks 3-8 as a full validation
+    (tune transitions, width limits, order date windows, 24 hours per day).
+    The daily open-line count and order quantities are updated from the
+    changed line-days only.
+    """
+
+    def __init__(self, orders, schedule, start_date, end_date, plant=None):
+        self.schedule = schedule
+        self.dates = list(schedule)
+        self.day_index = {date: day for day, date in enumerate(self.dates)}
+        self.validator = Validator(orders, schedule, start_date, end_date, plant=plant)
+        self.validator.validate_dates()
+        self.plant = self.validator.plant
+        line_nos = self.plant.lines
+
+        run = ScheduleState(calendar=self.validator.calendar, plant=self.plant)
+        self.checkpoints = {line_no: [] for line_no in line_nos}
+        self.open_flags = {line_no: [] for line_no in line_nos}
+        self.open_count = []
+        for date, lines in schedule.items():
+            if not self.validator.check_pass:
+                break
+            for line_no in line_nos:
+                self.checkpoints[line_no].append(run.line_states[line_no].copy())
+            self.validator.check_day(run, date, lines)
+            for line_no in line_nos:
+                self.open_flags[line_no].append(line_no in run.open_line_per_day)
+            self.open_count.append(len(run.open_line_per_day))
+        if self.validator.check_pass:
+            self.validator.check_orders(run)
+        if not self.validator.check_pass:
+            raise ValueError('Moves can only be evaluated on a valid schedule: ' + self.validator.check_msg)
+        for line_no in line_nos:
+            self.checkpoints[line_no].append(run.line_states[line_no].copy())
+
+    def swap(self, date_a, line_a, index_a, date_b, line_b, index_b):
+        """Changes that exchange two items, on the same or different lines and days.
+
+        Moving an order to another line is a swap with a "stop" item of the same hours.
+        """
+        items_a = list(self.schedule[date_a][line_a])
+        if (date_a, line_a) == (date_b, line_b):
+            items_a[index_a], items_a[index_b] = items_a[index_b], items_a[index_a]
+            return {(date_a, line_a): items_a}
+        items_b = list(self.schedule[date_b][line_b])
+        items_a[index_a], items_b[index_b] = items_b[index_b], items_a[index_a]
+        return {(date_a, line_a): items_a, (date_b, line_b): items_b}
+
+    def set_mfg_width(self, date, line_no, index, mfg_width):
+        """Changes that set the mfg_width of one item."""
+        items = list(self.schedule[date][line_no])
+        items[index] = dict(items[index], mfg_width=mfg_width)
+        return {(date, line_no): items}
+
+    def evaluate(self, changes):
+        """Return the violations the changes would introduce; empty when the move is feasible."""
+        return self._recheck(changes)[0]
+
+    def apply(self, changes):
+        """Apply the changes if they keep the schedule feasible and return the violations."""
+        violations, checkpoints, open_flags = self._recheck(changes)
+        if violations:
+            return violations
+        for (date, line_no), items in changes.items():
+            self.schedule[date][line_no] = items
+        for line_no, states in checkpoints.items():
+            for day, state in states.items():
+                self.checkpoints[line_no][day] = state
+        for (line_no, day), is_open in open_flags.items():
+            self.open_count[day] += is_open - self.open_flags[line_no][day]
+            self.open_flags[line_no][day] = is_open
+        return violations
+
+    def _recheck(self, changes):
+        val = self.validator
+        val.check_pass = True
+        val.violations = []
+
+        changed_days = {}
+        for (date, line_no), items in changes.items():
+            changed_days.setdefault(line_no, {})[self.day_index[date]] = items
+
+        checkpoints = {}
+        open_flags = {}
+        for line_no, days in changed_days.items():
+            if line_no not in self.checkpoints:
+                return [Violation('line_name', 'Wrong production lines.', None, line_no, None)], {}, {}
+            last_changed = max(days)
+            state = self.checkpoints[line_no][min(days)].copy()
+            run = ScheduleState([line_no], self.validator.calendar, self.plant)
+            run.line_states[line_no] = state
+            new_states = checkpoints[line_no] = {}
+            for day in range(min(days), len(self.dates)):
+                if day > last_changed and state == self.checkpoints[line_no][day]:
+                    break
+                date = self.dates[day]
+                run.start_day(date)
+                val.check_line_day(run, line_no, days.get(day, self.schedule[date][line_no]))
+                if not val.check_pass:
+                    return val.violations, {}, {}
+                new_states[day + 1] = state.copy()
+                open_flags[line_no, day] = line_no in run.open_line_per_day
+
+        #  9. Open-line count of the days whose open flags changed.
+        open_delta = {}
+        for (line_no, day), is_open in open_flags.items():
+            open_delta[day] = open_delta.get(day, 0) + is_open - self.open_flags[line_no][day]
+        for day, delta in sorted(open_delta.items()):
+            open_lines = self.plant.open_lines
+            if delta and self.open_count[day] + delta not in open_lines:
+                msg = 'The number of open production lines should be between {} and {}.'.format(open_lines[0],
+                                                                                                  open_lines[-1])
+                return [Violation('open_lines', msg, self.dates[day], None, None)], {}, {}
+
+        #  11. Produced quantities only move between items of the changed line-days.
+        amount_delta = {}
+        for (date, line_no), items in changes.items():
+            for sign, line_data in ((1, items), (-1, self.schedule[date][line_no])):
+                for data in line_data:
+                    amount_delta[data['order_code']] = amount_delta.get(data['order_code'], 0) + \
+                        sign * data['hours'] * 125
+        for order, delta in amount_delta.items():
+            if delta and order in val.orders:
+                msg = 'Wrong production quantity for order: {}.'.format(order)
+                return [Violation('quantity', msg, None, None, order)], {}, {}
+        return [], checkpoints, open_flags
@@ -0,0 +1,131 @@
+#  Copyright (c) 2020 Industrial Technology Research Institute.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+import csv
+import datetime
+import hashlib
+import re
+
+order_columns = ['product_code', 'material', 'composition', 'type', 'width', 'quantity', 'not_before', 'not_after']
+# Cells read as missing (NaN), as pandas.read_csv does by default.
+na_values = {'', '#N/A', '#N/A N/A', '#NA', '-1.#IND', '-1.#QNAN', '-NaN', '-nan', '1.#IND', '1.#QNAN', '<NA>', 'N/A',
+             'NA', 'NULL', 'NaN', 'None', 'n/a', 'nan', 'null'}
+# Numbers as pandas.read_csv reads them: ASCII digits, sign, point and exponent, or infinity.
+_int_pattern = re.compile(r'\s*[+-]?[0-9]+\s*\Z')
+_float_pattern = re.compile(r'\s*[+-]?(?:(?:[0-9]+\.?[0-9]*|\.[0-9]+)(?:[eE][+-]?[0-9]+)?|inf|infinity)\s*\Z',
+                            re.IGNORECASE)
+
+
+def date_ordinal(date):
+    """Convert a 'YYYY-MM-DD' string to an integer day ordinal."""
+    return datetime.datetime.strptime(date, '%Y-%m-%d').toordinal()
+
+
+def file_digest(path):
+    """SHA-256 hex digest of a file's bytes."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def parse_column(values):
+    """Type one CSV column like pandas.read_csv does for the columns of an order file.
+
+    The column becomes ints if every cell is an integer, floats if every cell
+    is a number, and strings otherwise; missing cells are NaN in all cases.
+    Only ASCII numbers count, so '1_000' or full-width digits stay strings.
+    Unlike pandas, True/False columns stay strings and integers beyond 64
+    bits stay ints.
+    """
+    cells = [None if value in na_values else value for value in values]
+    for pattern, convert in ((_int_pattern, int), (_float_pattern, float)):
+        if not all(cell is None or pattern.match(cell) for cell in cells):
+            continue
+        column = [None if cell is None else convert(cell) for cell in cells]
+        if convert is int and None not in column:
+            return column
+        return [float('nan') if cell is None else float(cell) for cell in column]
+    return [float('nan') if cell is None else cell for cell in cells]
+
+
+def read_order_csv(order_file):
+    """Read an order file into ``(order codes, {column: values})`` with only the csv module."""
+    with open(order_file, newline='', encoding='utf-8-sig') as f:
+        rows = [row for row in csv.reader(f) if row]  # Blank lines are skipped, as in pandas.read_csv.
+    if not rows:
+        raise ValueError('No columns to parse from file')
+    header = rows.pop(0)
+    if 'order_code' not in header:
+        raise ValueError('Index order_code invalid')
+    columns = {name: parse_column([row[i] if i < len(row) else '' for row in rows])
+               for i, name in enumerate(header)}
+    return columns.pop('order_code'), columns
+
+
+class OrderTable:
+    """Order information compiled once for per-item lookups.
+
+    Order codes are hashed to row numbers and every column is kept as a plain
+    list indexed by row, so a schedule item costs one dict lookup no matter how
+    large the order book is. ``not_before`` and ``not_after`` are stored as day
+    ordinals; rows whose dates cannot be parsed keep the parser message in
+    ``date_errors`` so it can be reported when the order is scheduled.
+    """
+
+    def __init__(self, codes, columns):
+        """``codes`` lists the order codes and ``columns`` maps every name in ``order_columns`` to its values."""
+        self.digest = None
+        self.codes = list(codes)
+        self.index = {code: row for row, code in enumerate(self.codes)}
+        self.product_code = list(columns['product_code'])
+        self.material = list(columns['material'])
+        self.composition = list(columns['composition'])
+        self.type = list(columns['type'])
+        self.width = list(columns['width'])
+        self.quantity = list(columns['quantity'])
+        self.not_before = []
+        self.not_after = []
+        self.date_errors = {}
+        for row, (not_before, not_after) in enumerate(zip(columns['not_before'], columns['not_after'])):
+            try:
+                not_before = date_ordinal(not_before.split('T')[0])
+                not_after = date_ordinal(not_after.split('T')[0])
+            except Exception as e:
+                not_before = not_after = None
+                self.date_errors[row] = str(e)
+            self.not_before.append(not_before)
+            self.not_after.append(not_after)
+
+    @classmethod
+    def from_csv(cls, order_file):
+        """Read and compile an order file such as orders_2019.csv without importing pandas.
+
+        ``digest`` is set to the SHA-256 of the file so results can be cached per order file.
+        """
+        table = cls(*read_order_csv(order_file))
+        table.digest = file_digest(order_file)
+        return table
+
+    @classmethod
+    def from_dataframe(cls, order_df):
+        """Compile orders already loaded in a pandas DataFrame indexed by order_code."""
+        return cls(order_df.index.tolist(), {name: order_df[name].tolist() for name in order_columns})
+
+    def __len__(self):
+        return len(self.codes)
+
+    def __contains__(self, order_code):
+        return order_code in self.index
@@ -0,0 +1,111 @@
+#  Copyright (c) 2020 Industrial Technology Research Institute.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+import hashlib
+import json
+import argparse
+from query_table import valid_prod_line, valid_k_line, valid_ms_line, valid_open_lines, valid_prod_no, \
+    width_constraint, width_margin, initial_state
+
+
+def query_table_spec():
+    """The plant of query_table.py as a plant-model dict, the layout of a plant file."""
+    return {
+        'lines': valid_prod_line,
+        'initial_state': initial_state,
+        'products': valid_prod_no,
+        'product_lines': {code: valid_k_line for code in valid_prod_no if 'K' in code},
+        'material_lines': {'MS': valid_ms_line},
+        'width_constraint': width_constraint,
+        'width_margin': width_margin,
+        'open_lines': valid_open_lines,
+    }
+
+
+class PlantModel:
+    """Plant rules compiled into constant-time lookup tables.
+
+    Every line gets a bit position, and the lines a product or material may be
+    produced on are kept as an integer bitmask, so an eligibility check is one
+    dict lookup and one AND however many lines the plant has. Width limits are
+    flattened to ``(line, type) -> (max_mfg_width, max_width)``.
+
+    A plant file is JSON with the keys of ``query_table_spec``: ``lines``,
+    ``initial_state`` (type of each line before the schedule), ``products``,
+    ``product_lines`` and ``material_lines`` (lines that restricted products
+    and materials are limited to; others may use every line),
+    ``width_constraint``, ``width_margin`` (minimum mfg_width - width per type)
+    and ``open_lines`` (minimum and maximum open lines per day).
+    """
+
+    def __init__(self, spec):
+        self.lines = list(spec['lines'])
+        self.line_set = frozenset(self.lines)
+        self.line_bit = {line_no: 1 << bit for bit, line_no in enumerate(self.lines)}
+        self.all_lines = (1 << len(self.lines)) - 1
+        self.initial_state = {line_no: spec['initial_state'][line_no] for line_no in self.lines}
+
+        self.product_lines = dict.fromkeys(spec['products'], self.all_lines)
+        for code, lines in spec.get('product_lines', {}).items():
+            if code not in self.product_lines:
+                raise ValueError('Line restriction for unknown product: {}.'.format(code))
+            self.product_lines[code] = self.line_mask(lines)
+        self.material_lines = {material: self.line_mask(lines)
+                               for material, lines in spec.get('material_lines', {}).items()}
+
+        self.width_limits = {}
+        for line_no, limits in spec['width_constraint'].items():
+            if line_no not in self.line_bit:
+                raise ValueError('Width constraint for unknown line: {}.'.format(line_no))
+            for product_type, max_mfg_width in limits['max_mfg_width'].items():
+                if max_mfg_width:
+                    self.width_limits[line_no, product_type] = (max_mfg_width, limits['max_width'][product_type])
+        self.width_margin = dict(spec.get('width_margin', {}))
+        min_open, max_open = spec.get('open_lines', [1, len(self.lines)])
+        self.open_lines = range(min_open, max_open + 1)
+        self.digest = hashlib.sha256(json.dumps(spec, sort_keys=True).encode()).hexdigest()
+
+    def line_mask(self, lines):
+        mask = 0
+        for line_no in lines:
+            if line_no not in self.line_bit:
+                raise ValueError('Unknown production line: {}.'.format(line_no))
+            mask |= self.line_bit[line_no]
+        return mask
+
+    @classmethod
+    def load(cls, plant_file):
+        """Read and compile a plant file."""
+        with open(plant_file) as f:
+            return cls(json.load(f))
+
+
+_default_plant = None
+
+
+def default_plant():
+    """The compiled plant of query_table.py, built on first use."""
+    global _default_plant
+    if _default_plant is None:
+        _default_plant = PlantModel(query_table_spec())
+    return _default_plant
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser("plant_model")
+    parser.add_argument("--output", default='plant.json', type=str,
+                        help="write the plant of query_table.py to this file as a starting point")
+    args = parser.parse_args()
+    with open(args.output, 'w') as f:
+        json.dump(query_table_spec(), f, indent=2)
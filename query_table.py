@@ -14,6 +14,8 @@
 
 valid_prod_line = ['A1', 'A2', 'A3', 'B1', 'B2', 'B3', 'B4', 'B5', 'C1']
 valid_k_line = ['B1', 'B2', 'B3', 'B4']
+valid_ms_line = ['C1']
+valid_open_lines = [2, 6]
 valid_keys = ['order_code', 'product_code', 'hours', 'mfg_width']
 valid_prod_no = [
     'N001',
@@ -77,72 +79,7 @@ width_constraint = {
     'B5': {'max_mfg_width': {'plate': 1450, 'lenti': 1450}, 'max_width': {'plate': 1300, 'lenti': 1300}},
     'C1': {'max_mfg_width': {'plate': 1450, 'lenti': 1450}, 'max_width': {'plate': 1300, 'lenti': 1300}}
 }
-type_transition = {
-    'A1': [],
-    'A2': [],
-    'A3': [],
-    'B1': [],
-    'B2': [],
-    'B3': [],
-    'B4': [],
-    'B5': [],
-    'C1': []
-}
-code_type_transition = {
-    'A1': [],
-    'A2': [],
-    'A3': [],
-    'B1': [],
-    'B2': [],
-    'B3': [],
-    'B4': [],
-    'B5': [],
-    'C1': []
-}
-composition_transition = {
-    'A1': [],
-    'A2': [],
-    'A3': [],
-    'B1': [],
-    'B2': [],
-    'B3': [],
-    'B4': [],
-    'B5': [],
-    'C1': []
-}
-tune_hour_state = {
-    'A1': 0,
-    'A2': 0,
-    'A3': 0,
-    'B1': 0,
-    'B2': 0,
-    'B3': 0,
-    'B4': 0,
-    'B5': 0,
-    'C1': 0
-}
-state_transition = {
-    'A1': [],
-    'A2': [],
-    'A3': [],
-    'B1': [],
-    'B2': [],
-    'B3': [],
-    'B4': [],
-    'B5': [],
-    'C1': []
-}
-mfg_transition = {
-    'A1': [],
-    'A2': [],
-    'A3': [],
-    'B1': [],
-    'B2': [],
-    'B3': [],
-    'B4': [],
-    'B5': [],
-    'C1': []
-}
+width_margin = {'lenti': 70, 'plate': 50}
 special_order_code = ['stop', 'tune_8', 'tune_48']
 tune_order_code = ['tune_8', 'tune_48']
 initial_state = {
@@ -156,3 +93,6 @@ initial_state = {
     'B5': 'lenti',
     'C1': 'lenti'
 }
+# Version of the tables above and the checks in validator.py; bump it whenever a rule changes so
+# results cached by result_cache.py are not reused.
+rule_version = 1
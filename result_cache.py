@@ -0,0 +1,131 @@
+#  Copyright (c) 2020 Industrial Technology Research Institute.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+import hashlib
+import json
+import os
+import tempfile
+import time
+from order_table import OrderTable, file_digest
+from plant_model import default_plant
+from query_table import rule_version
+
+
+class ResultCache:
+    """Validation results stored on disk under a hash of everything they depend on.
+
+    The key covers the bytes of the submission and the order file, the start
+    and end dates, the violation budget, the plant model and
+    ``query_table.rule_version``, so a byte-identical resubmission gets the
+    stored verdict, message and violations without being checked again. Each
+    result is one JSON file; reading it refreshes its modification time.
+    ``evict`` removes entries older than ``max_age`` seconds and then the
+    least recently used ones until the cache fits in ``max_bytes``; it runs
+    when the cache is opened and whenever a store takes the cache over
+    ``max_bytes``.
+    """
+
+    def __init__(self, cache_dir, max_bytes=256 << 20, max_age=30 * 24 * 3600):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.evictions = 0
+        self.size = 0
+        os.makedirs(cache_dir, exist_ok=True)
+        self.evict()
+
+    def key(self, order_file, submit_file, start_date, end_date, max_violations=1, plant=None):
+        """Cache key of a validation, or None if an input cannot be read (it is not cached then).
+
+        ``order_file`` is a path or an OrderTable compiled by ``OrderTable.from_csv``.
+        """
+        try:
+            if isinstance(order_file, OrderTable):
+                order_digest = order_file.digest
+                if order_digest is None:
+                    return None
+            else:
+                order_digest = file_digest(order_file)
+            submit_digest = file_digest(submit_file)
+        except OSError:
+            return None
+        plant_digest = (plant or default_plant()).digest
+        text = json.dumps([rule_version, plant_digest, order_digest, submit_digest, start_date, end_date,
+                           max_violations])
+        return hashlib.sha256(text.encode()).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key + '.json')
+
+    def get(self, key):
+        """The stored result for ``key``, or None on a miss."""
+        path = self._path(key)
+        try:
+            with open(path) as f:
+                result = json.load(f)
+            os.utime(path)
+        except (OSError, ValueError):
+            self.misses += 1
+            return None
+        self.hits += 1
+        return result
+
+    def put(self, key, result):
+        """Store a result (check_pass, check_msg and violations) and evict if the cache is full."""
+        result = {name: result[name] for name in ('check_pass', 'check_msg', 'violations')}
+        fd, tmp = tempfile.mkstemp(dir=self.cache_dir, suffix='.tmp')
+        with os.fdopen(fd, 'w') as f:
+            json.dump(result, f)
+            self.size += f.tell()
+        os.replace(tmp, self._path(key))
+        self.stores += 1
+        if self.max_bytes is not None and self.size > self.max_bytes:
+            self.evict()
+
+    def _entries(self):
+        entries = []
+        for entry in os.scandir(self.cache_dir):
+            if entry.name.endswith('.json'):
+                try:
+                    stat = entry.stat()
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+        return sorted(entries)
+
+    def evict(self):
+        """Remove expired entries, then the least recently used ones over ``max_bytes``."""
+        entries = self._entries()
+        total = sum(size for _, size, _ in entries)
+        now = time.time()
+        for mtime, size, path in entries:
+            expired = self.max_age is not None and now - mtime > self.max_age
+            if not expired and (self.max_bytes is None or total <= self.max_bytes):
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+            self.evictions += 1
+        self.size = total
+
+    def stats(self):
+        """Hit and miss counters of this instance and the current size of the cache."""
+        entries = self._entries()
+        return {'hits': self.hits, 'misses': self.misses, 'stores': self.stores, 'evictions': self.evictions,
+                'entries': len(entries), 'bytes': sum(size for _, size, _ in entries)}
@@ -0,0 +1,63 @@
+#  Copyright (c) 2020 Industrial Technology Research Institute.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+from time import perf_counter
+
+# Timed phases, named after the numbered checks of Validator.
+rule_groups = [
+    'load_json',         # 1. JSON format
+    'load_csv',          # Order file
+    'dates',             # 2. Scheduled dates
+    'lines',             # 3. Production lines, 24 hours per line-day and item bookkeeping
+    'fields',            # 4. Order code, product code, hours and mfg_width
+    'date_window',       # 5. Date constraints
+    'line_constraints',  # 6. MS and K line constraints
+    'width',             # 7. Width constraints
+    'tune',              # 8. Tune transitions
+    'line_count',        # 9. Production line count per day
+    'orders',            # 10-11. Order and quantity completeness
+]
+
+
+class RuleProfile:
+    """Call counts and cumulative wall time of each rule group.
+
+    The validator switches the current group with ``enter`` as it moves
+    between numbered checks; the time since the previous switch is charged to
+    the group that was current, so the groups add up to the checked time.
+    One profile can be passed to many validations to accumulate totals.
+    """
+
+    def __init__(self):
+        self.calls = dict.fromkeys(rule_groups, 0)
+        self.seconds = dict.fromkeys(rule_groups, 0.0)
+        self.group = None
+        self.since = 0.0
+
+    def enter(self, group, calls=1):
+        now = perf_counter()
+        if self.group is not None:
+            self.seconds[self.group] += now - self.since
+        self.group = group
+        self.since = now
+        self.calls[group] += calls
+
+    def stop(self):
+        if self.group is not None:
+            self.seconds[self.group] += perf_counter() - self.since
+            self.group = None
+
+    def summary(self):
+        """Machine-readable totals: {group: {'calls': n, 'seconds': s}}."""
+        return {group: {'calls': self.calls[group], 'seconds': self.seconds[group]} for group in rule_groups}
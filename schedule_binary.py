@@ -0,0 +1,191 @@
+#  Copyright (c) 2020 Industrial Technology Research Institute.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+import json
+import mmap
+import struct
+import argparse
+from collections.abc import Mapping
+import numpy as np
+from query_table import valid_keys
+from validator import binary_schedule_magic
+
+# One row per scheduled item, in schedule order.
+item_dtype = np.dtype([('day', '<i4'), ('line', '<i4'), ('seq', '<i4'), ('order_code', '<i4'),
+                       ('product_code', '<i4'), ('hours', '<i8'), ('mfg_width', '<i8')])
+# One row per (date, line) entry, in schedule order; its items are items[start:start + count].
+line_day_dtype = np.dtype([('day', '<i4'), ('line', '<i4'), ('start', '<i8'), ('count', '<i8')])
+_int64 = range(-2 ** 63, 2 ** 63)
+_align = 64
+
+
+def _intern(table, index, value):
+    if value not in index:
+        index[value] = len(table)
+        table.append(value)
+    return index[value]
+
+
+def schedule_to_arrays(schedule):
+    """Encode a {date: {line: [items]}} schedule as string tables and structured arrays.
+
+    Dates, lines and codes are kept in string tables and referenced by
+    position, in the order they first appear, so the encoding is lossless.
+    A ValueError is raised for anything the format cannot hold exactly: a
+    non-dict day, a non-list line, an item without exactly the keys in
+    ``valid_keys``, non-string codes, or hours and mfg_width that are not
+    64-bit integers (booleans included). Such schedules are validated from
+    JSON instead.
+    """
+    lines, line_index = [], {}
+    codes, code_index = [], {}
+    line_days = []
+    items = []
+    for day, (date, day_lines) in enumerate(schedule.items()):
+        if not isinstance(date, str) or not isinstance(day_lines, dict):
+            raise ValueError('{}: Only {{date: {{line: [items]}}}} schedules can be encoded.'.format(date))
+        for line_no, line_data in day_lines.items():
+            if not isinstance(line_no, str) or not isinstance(line_data, list):
+                raise ValueError('{}, {}: Scheduled items should be a list.'.format(date, line_no))
+            line = _intern(lines, line_index, line_no)
+            line_days.append((day, line, len(items), len(line_data)))
+            for seq, data in enumerate(line_data):
+                if not isinstance(data, dict) or set(data) != set(valid_keys):
+                    raise ValueError('{}, {}: Item {} cannot be encoded.'.format(date, line_no, seq))
+                for name in ('order_code', 'product_code'):
+                    if not isinstance(data[name], str):
+                        raise ValueError('{}, {}: "{}" is not string.'.format(date, line_no, name))
+                for name in ('hours', 'mfg_width'):
+                    if type(data[name]) is not int or data[name] not in _int64:
+                        raise ValueError('{}, {}: "{}" is not a 64-bit integer.'.format(date, line_no, name))
+                items.append((day, line, seq, _intern(codes, code_index, data['order_code']),
+                              _intern(codes, code_index, data['product_code']), data['hours'], data['mfg_width']))
+    return (list(schedule), lines, codes, np.array(line_days, dtype=line_day_dtype),
+            np.array(items, dtype=item_dtype))
+
+
+def write_binary_schedule(schedule, binary_file):
+    """Write a schedule dict in the binary layout read by BinarySchedule."""
+    dates, lines, codes, line_days, items = schedule_to_arrays(schedule)
+    header = json.dumps({'version': 1, 'dates': dates, 'lines': lines, 'codes': codes,
+                         'line_days': len(line_days), 'items': len(items)}).encode()
+    offset = -(-(len(binary_schedule_magic) + 8 + len(header)) // _align) * _align
+    with open(binary_file, 'wb') as f:
+        f.write(binary_schedule_magic)
+        f.write(struct.pack('<Q', len(header)))
+        f.write(header)
+        f.write(b'\0' * (offset - f.tell()))
+        f.write(line_days.tobytes())
+        f.write(items.tobytes())
+
+
+class BinarySchedule(Mapping):
+    """A binary schedule file, memory-mapped and read as the {date: {line: [items]}} layout.
+
+    Nothing is decoded up front: looking up a date builds the item dicts of
+    that day from the mapped arrays, so a whole-schedule validation touches
+    each item once and keeps only one day in Python objects. Processes that
+    open the same file share its pages through the OS page cache. The raw
+    arrays are available for columnar access as ``line_day_table`` and
+    ``item_table``.
+    """
+
+    def __init__(self, binary_file):
+        self.path = binary_file
+        with open(binary_file, 'rb') as f:
+            if f.read(len(binary_schedule_magic)) != binary_schedule_magic:
+                raise ValueError('{} is not a binary schedule file.'.format(binary_file))
+            header_size, = struct.unpack('<Q', f.read(8))
+            header = json.loads(f.read(header_size))
+            self.buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self.dates = header['dates']
+        self.lines = header['lines']
+        self.codes = header['codes']
+        self.day_index = {date: day for day, date in enumerate(self.dates)}
+        offset = -(-(len(binary_schedule_magic) + 8 + header_size) // _align) * _align
+        self.line_day_table = np.frombuffer(self.buffer, line_day_dtype, header['line_days'], offset)
+        self.item_table = np.frombuffer(self.buffer, item_dtype, header['items'],
+                                        offset + line_day_dtype.itemsize * header['line_days'])
+        # line_days rows of day d are day_rows[d]:day_rows[d + 1].
+        self.day_rows = np.searchsorted(self.line_day_table['day'], np.arange(len(self.dates) + 1)).tolist()
+
+    def _decode(self, first, last):
+        """Item dicts of item_table[first:last]."""
+        items = self.item_table[first:last]
+        codes = self.codes
+        return [{'order_code': codes[order_code], 'product_code': codes[product_code], 'hours': hours,
+                 'mfg_width': mfg_width}
+                for order_code, product_code, hours, mfg_width
+                in zip(items['order_code'].tolist(), items['product_code'].tolist(), items['hours'].tolist(),
+                       items['mfg_width'].tolist())]
+
+    def __getitem__(self, date):
+        day = self.day_index[date]
+        rows = self.line_day_table[self.day_rows[day]:self.day_rows[day + 1]].tolist()
+        if not rows:
+            return {}
+        first = rows[0][2]
+        items = self._decode(first, rows[-1][2] + rows[-1][3])
+        return {self.lines[line]: items[start - first:start - first + count] for _, line, start, count in rows}
+
+    def __iter__(self):
+        return iter(self.dates)
+
+    def __len__(self):
+        return len(self.dates)
+
+    def __contains__(self, date):
+        return date in self.day_index
+
+    def day_lines(self):
+        """The line names of every day, in schedule order, without decoding any item."""
+        lines = [self.lines[line] for line in self.line_day_table['line'].tolist()]
+        return [lines[self.day_rows[day]:self.day_rows[day + 1]] for day in range(len(self.dates))]
+
+    def line_schedule(self, line_no):
+        """``(day, position, date, items)`` of every day that schedules ``line_no``, as used by check_line."""
+        if line_no not in self.lines:
+            return []
+        rows = np.flatnonzero(self.line_day_table['line'] == self.lines.index(line_no)).tolist()
+        schedule = []
+        for row in rows:
+            day, _, start, count = self.line_day_table[row].tolist()
+            schedule.append((day, row - self.day_rows[day], self.dates[day], self._decode(start, start + count)))
+        return schedule
+
+    def to_dict(self):
+        return {date: self[date] for date in self.dates}
+
+
+def json_to_binary(json_file, binary_file):
+    with open(json_file) as f:
+        write_binary_schedule(json.load(f), binary_file)
+
+
+def binary_to_json(binary_file, json_file):
+    with open(json_file, 'w') as f:
+        json.dump(BinarySchedule(binary_file).to_dict(), f)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser("schedule_binary")
+    parser.add_argument("--input", required=True, type=str, help="JSON submission or binary schedule file")
+    parser.add_argument("--output", required=True, type=str, help="converted file")
+    args = parser.parse_args()
+    with open(args.input, 'rb') as f:
+        is_binary = f.read(len(binary_schedule_magic)) == binary_schedule_magic
+    if is_binary:
+        binary_to_json(args.input, args.output)
+    else:
+        json_to_binary(args.input, args.output)
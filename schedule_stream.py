@@ -0,0 +1,157 @@
+#  Copyright (c) 2020 Industrial Technology Research Institute.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+import json
+from validator import Validator, ScheduleState, handle_validation_errors
+
+_decoder = json.JSONDecoder()
+_whitespace = ' \t\n\r'
+
+
+class _StreamBuffer:
+    """Text read from a file that is only kept until it has been decoded."""
+
+    def __init__(self, f, chunk_size):
+        self.f = f
+        self.chunk_size = chunk_size
+        self.text = ''
+        self.pos = 0
+        self.offset = 0
+        self.eof = False
+
+    def fill(self):
+        chunk = self.f.read(self.chunk_size)
+        if not chunk:
+            self.eof = True
+            return False
+        self.offset += self.pos
+        self.text = self.text[self.pos:] + chunk
+        self.pos = 0
+        return True
+
+    def error(self, msg, pos=None):
+        pos = self.pos if pos is None else pos
+        return ValueError('{}: char {}'.format(msg, self.offset + pos))
+
+    def peek(self):
+        """Skip whitespace and return the next character, or '' at the end of the file."""
+        while True:
+            while self.pos < len(self.text) and self.text[self.pos] in _whitespace:
+                self.pos += 1
+            if self.pos < len(self.text):
+                return self.text[self.pos]
+            if not self.fill():
+                return ''
+
+    def expect(self, char, msg):
+        if self.peek() != char:
+            raise self.error(msg)
+        self.pos += 1
+
+    def decode(self):
+        """Decode the next JSON value, reading more of the file only while it may be incomplete."""
+        self.peek()
+        while True:
+            try:
+                value, end = _decoder.raw_decode(self.text, self.pos)
+            except json.JSONDecodeError as e:
+                truncated = len(self.text) - e.pos < 16 or e.msg.startswith('Unterminated string')
+                if self.eof or not truncated or not self.fill():
+                    raise self.error(e.msg, e.pos)
+                continue
+            if end == len(self.text) and isinstance(value, (int, float)) and self.fill():
+                continue
+            self.pos = end
+            return value
+
+
+def iter_schedule(f, chunk_size=1 << 16):
+    """Yield the ``(date, lines)`` pairs of a submission file one day at a time.
+
+    Only the day being decoded is held in memory. A ValueError is raised as
+    soon as the text read so far cannot be a valid {date: {line: [items]}}
+    document, without reading the rest of the file.
+    """
+    buf = _StreamBuffer(f, chunk_size)
+    buf.expect('{', "Expecting '{'")
+    if buf.peek() == '}':
+        buf.pos += 1
+    else:
+        while True:
+            if buf.peek() != '"':
+                raise buf.error('Expecting property name enclosed in double quotes')
+            date = buf.decode()
+            buf.expect(':', "Expecting ':' delimiter")
+            yield date, buf.decode()
+            if buf.peek() == '}':
+                buf.pos += 1
+                break
+            buf.expect(',', "Expecting ',' delimiter")
+    if buf.peek():
+        raise buf.error('Extra data')
+
+
+def validate_stream(order_file, json_file, start_date, end_date, max_violations=1, chunk_size=1 << 16, plant=None):
+    """Validate a submission file while parsing it, one day at a time.
+
+    Each day goes through the date checks and checks 3-9 as soon as it is
+    decoded, so memory does not grow with the horizon and a bad date, a bad
+    day or malformed JSON stops the pass without reading the rest of the
+    file. Violations are reported in file order, so the first one can differ
+    from ``Validator``, which checks all dates before any schedule item.
+    A date that appears twice is reported instead of silently merged.
+    Returns the Validator holding the verdict, violations and metrics.
+    """
+    val = Validator(order_file, {}, start_date, end_date, max_violations, plant=plant)
+    run = ScheduleState(calendar=val.calendar, plant=val.plant)
+    val.metrics = run.metrics
+    if not val.can_check():
+        return val
+
+    calendar = val.calendar
+    seen = bytearray(len(calendar))
+    previous = None
+    try:
+        f = open(json_file)
+    except OSError as e:
+        handle_validation_errors(val, str(e), 'json_format')
+        return val
+    with f:
+        days = iter_schedule(f, chunk_size)
+        while True:
+            try:
+                date, lines = next(days)
+            except StopIteration:
+                break
+            except ValueError as e:
+                handle_validation_errors(val, str(e), 'json_format')
+                return val
+            previous = val.check_date(date, previous)
+            if date in calendar.days:
+                day = calendar.days[date] - calendar.start
+                if seen[day]:
+                    handle_validation_errors(val, '{}: Duplicate date.'.format(date), 'date_order', date)
+                seen[day] = 1
+            if val.stop_checking():
+                return val
+            val.check_day(run, date, lines)
+            if val.stop_checking():
+                return val
+
+    if not all(seen):
+        handle_validation_errors(val, 'Not all dates are included.', 'date_missing')
+        if val.stop_checking():
+            return val
+    val.check_orders(run)
+    return val
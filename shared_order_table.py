@@ -0,0 +1,255 @@
+#  Copyright (c) 2020 Industrial Technology Research Institute.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+import json
+import mmap
+import os
+import struct
+import tempfile
+import zlib
+from array import array
+from collections.abc import Mapping, Sequence
+from contextlib import contextmanager
+from order_table import OrderTable, order_columns
+
+order_table_magic = b'CTSPORD1'
+_align = 8
+_formats = {'int': 'q', 'float': 'd', 'str': 'i'}
+# Columns stored as written; not_before and not_after are stored as day ordinals.
+_value_columns = [name for name in order_columns if name not in ('not_before', 'not_after')]
+
+
+def _code_key(code):
+    return code.encode('utf-8', 'surrogatepass')
+
+
+def _column_kind(values):
+    """'int', 'float' or 'str' (strings with NaN for missing cells), as parse_column types a column."""
+    if all(type(value) is int for value in values):
+        return 'int'
+    if all(type(value) is float for value in values):
+        return 'float'
+    if all(type(value) is str or (type(value) is float and value != value) for value in values):
+        return 'str'
+    raise ValueError('Order table column with mixed types cannot be shared.')
+
+
+def write_order_table(orders, table_file):
+    """Write an OrderTable in the layout read by SharedOrderTable.
+
+    Raises ValueError for a table the layout cannot hold exactly (order codes
+    that are not strings, columns with mixed types or integers beyond 64 bits).
+    """
+    codes = orders.codes
+    if not all(isinstance(code, str) for code in codes):
+        raise ValueError('Order codes that are not strings cannot be shared.')
+    keys = [_code_key(code) for code in codes]
+    code_offsets = array('q', [0])
+    for key in keys:
+        code_offsets.append(code_offsets[-1] + len(key))
+
+    slots = 8
+    while slots < 2 * len(codes):
+        slots *= 2
+    index = array('i', [-1]) * slots
+    for row, key in enumerate(keys):
+        slot = zlib.crc32(key) & (slots - 1)
+        while index[slot] >= 0 and keys[index[slot]] != key:
+            slot = (slot + 1) & (slots - 1)
+        index[slot] = row
+
+    blocks = [('code_offsets', code_offsets.tobytes()), ('codes', b''.join(keys)), ('index', index.tobytes())]
+    columns = {}
+    strings = {}
+    for name in _value_columns:
+        values = getattr(orders, name)
+        kind = _column_kind(values)
+        if kind == 'str':
+            table = {}
+            for value in values:
+                if type(value) is str and value not in table:
+                    table[value] = len(table)
+            strings[name] = list(table)
+            values = [table.get(value, -1) if type(value) is str else -1 for value in values]
+        try:
+            blocks.append((name, array(_formats[kind], values).tobytes()))
+        except OverflowError:
+            raise ValueError('Order table column {} cannot be shared.'.format(name))
+        columns[name] = kind
+    for name in ('not_before', 'not_after'):
+        blocks.append((name, array('q', [0 if day is None else day for day in getattr(orders, name)]).tobytes()))
+
+    offsets = {}
+    offset = 0
+    for name, data in blocks:
+        offsets[name] = offset
+        offset += -(-len(data) // _align) * _align
+    header = json.dumps({'version': 1, 'rows': len(codes), 'distinct_codes': len(orders.index), 'slots': slots,
+                         'columns': columns, 'strings': strings, 'offsets': offsets, 'digest': orders.digest,
+                         'date_errors': {str(row): msg for row, msg in orders.date_errors.items()}}).encode()
+    start = -(-(len(order_table_magic) + 8 + len(header)) // _align) * _align
+    with open(table_file, 'wb') as f:
+        f.write(order_table_magic)
+        f.write(struct.pack('<Q', len(header)))
+        f.write(header)
+        for name, data in blocks:
+            f.write(b'\0' * (start + offsets[name] - f.tell()))
+            f.write(data)
+
+
+class StringColumn(Sequence):
+    """A column of strings stored as positions in a table of its distinct values (-1 reads as NaN)."""
+
+    def __init__(self, positions, strings):
+        self.positions = positions
+        self.strings = strings
+
+    def __getitem__(self, row):
+        if isinstance(row, slice):
+            return [self[i] for i in range(*row.indices(len(self)))]
+        position = self.positions[row]
+        return self.strings[position] if position >= 0 else float('nan')
+
+    def __len__(self):
+        return len(self.positions)
+
+
+class CodeColumn(Sequence):
+    """The order codes, decoded from one UTF-8 blob on access."""
+
+    def __init__(self, offsets, blob):
+        self.offsets = offsets
+        self.blob = blob
+
+    def key(self, row):
+        return self.blob[self.offsets[row]:self.offsets[row + 1]]
+
+    def __getitem__(self, row):
+        if isinstance(row, slice):
+            return [self[i] for i in range(*row.indices(len(self)))]
+        if row < 0:
+            row += len(self)
+        return bytes(self.key(row)).decode('utf-8', 'surrogatepass')
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+
+class CodeIndex(Mapping):
+    """``{order code: row}`` as an open-addressing hash table in the mapped file.
+
+    Rows are found by CRC-32 of the UTF-8 code and linear probing, so the
+    table is the same in every process. A code listed twice maps to its last
+    row, as in OrderTable.index.
+    """
+
+    def __init__(self, slots, codes, size):
+        self.slots = slots
+        self.codes = codes
+        self.size = size
+
+    def get(self, code, default=None):
+        if not isinstance(code, str):
+            return default
+        key = _code_key(code)
+        mask = len(self.slots) - 1
+        slot = zlib.crc32(key) & mask
+        while True:
+            row = self.slots[slot]
+            if row < 0:
+                return default
+            if self.codes.key(row) == key:
+                return row
+            slot = (slot + 1) & mask
+
+    def __getitem__(self, code):
+        row = self.get(code)
+        if row is None:
+            raise KeyError(code)
+        return row
+
+    def __contains__(self, code):
+        return self.get(code) is not None
+
+    def __iter__(self):
+        for row, code in enumerate(self.codes):
+            if self.get(code) == row:
+                yield code
+
+    def __len__(self):
+        return self.size
+
+
+class SharedOrderTable(OrderTable):
+    """An order table file, memory-mapped and read in place by any number of processes.
+
+    Numeric columns are read through memoryviews of the mapped file, and
+    string columns as positions in a table of their distinct values, so
+    attaching costs one header read however many orders there are and every
+    process shares the same pages. It is used wherever an OrderTable is;
+    ``not_before`` and ``not_after`` are 0 for the rows in ``date_errors``.
+    """
+
+    def __init__(self, table_file):
+        self.path = table_file
+        with open(table_file, 'rb') as f:
+            if f.read(len(order_table_magic)) != order_table_magic:
+                raise ValueError('{} is not an order table file.'.format(table_file))
+            header_size, = struct.unpack('<Q', f.read(8))
+            header = json.loads(f.read(header_size))
+            self.buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        start = -(-(len(order_table_magic) + 8 + header_size) // _align) * _align
+        view = memoryview(self.buffer)
+        rows = header['rows']
+        offsets = header['offsets']
+
+        def block(name, fmt, count):
+            offset = start + offsets[name]
+            return view[offset:offset + struct.calcsize(fmt) * count].cast(fmt)
+
+        self.digest = header['digest']
+        self.codes = CodeColumn(block('code_offsets', 'q', rows + 1), view[start + offsets['codes']:])
+        self.index = CodeIndex(block('index', 'i', header['slots']), self.codes, header['distinct_codes'])
+        for name, kind in header['columns'].items():
+            column = block(name, _formats[kind], rows)
+            setattr(self, name, StringColumn(column, header['strings'][name]) if kind == 'str' else column)
+        self.not_before = block('not_before', 'q', rows)
+        self.not_after = block('not_after', 'q', rows)
+        self.date_errors = {int(row): msg for row, msg in header['date_errors'].items()}
+
+
+def attach_orders(orders):
+    """In a worker: the SharedOrderTable of an order table file path, or ``orders`` itself."""
+    return SharedOrderTable(orders) if isinstance(orders, str) else orders
+
+
+@contextmanager
+def shared_order_file(orders):
+    """Write ``orders`` to a temporary order table file for worker processes to attach to.
+
+    Yields the path, which ``attach_orders`` turns into a SharedOrderTable,
+    and removes the file on exit. A table that cannot be written is yielded
+    as it is, to be sent to the workers as before.
+    """
+    fd, table_file = tempfile.mkstemp(suffix='.orders')
+    os.close(fd)
+    try:
+        try:
+            write_order_table(orders, table_file)
+        except ValueError:
+            yield orders
+        else:
+            yield table_file
+    finally:
+        os.remove(table_file)
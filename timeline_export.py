@@ -0,0 +1,156 @@
+#  Copyright (c) 2020 Industrial Technology Research Institute.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+import csv
+import datetime
+import importlib
+import os
+from line_state import new_line_states
+from plant_model import default_plant
+from query_table import tune_order_code
+
+timeline_columns = ['day', 'line', 'sequence', 'start_hour', 'end_hour', 'order_code', 'product_code', 'type',
+                    'composition', 'mfg_width', 'tune_reason']
+
+
+def _value(value):
+    """Order table cell as exported: missing (NaN) cells become None."""
+    return None if isinstance(value, float) and value != value else value
+
+
+def schedule_timeline(orders, schedule, plant=None):
+    """Flatten a schedule into timeline columns, one row per item in schedule order.
+
+    ``start_hour`` and ``end_hour`` are the hours of the day the item
+    occupies on its line and ``sequence`` its position in the line-day.
+    Orders get the ``type`` and ``composition`` of the order table. A tune
+    gets the reasons the next order on its line needs it, joined by '+':
+    'start' (first order after a stop or the start of the schedule), 'type',
+    'composition' (changed to 0%) and 'mfg_width'; it is '' if none applies
+    and None for other items. The schedule is expected to have passed
+    validation; malformed items are not guarded against.
+    """
+    plant = plant or default_plant()
+    states = new_line_states(plant=plant)
+    stopped = dict.fromkeys(plant.lines, True)
+    pending = {line_no: [] for line_no in plant.lines}
+    timeline = {name: [] for name in timeline_columns}
+    row = 0
+    for date, lines in schedule.items():
+        day = datetime.datetime.strptime(date, '%Y-%m-%d').date()
+        for line_no, items in lines.items():
+            state = states[line_no]
+            hour = 0
+            for sequence, data in enumerate(items):
+                order_code = data['order_code']
+                order_row = orders.index.get(order_code)
+                product_type = composition = tune_reason = None
+                if order_row is not None:
+                    product_type = orders.type[order_row]
+                    composition = orders.composition[order_row]
+                    reasons = []
+                    if stopped[line_no]:
+                        reasons.append('start')
+                    if state.last_type and state.last_type != product_type:
+                        reasons.append('type')
+                    if state.last_composition and state.last_composition != '0%' and composition == '0%':
+                        reasons.append('composition')
+                    if state.last_mfg_width is not None and data['mfg_width'] != state.last_mfg_width:
+                        reasons.append('mfg_width')
+                    for tune_row in pending[line_no]:
+                        timeline['tune_reason'][tune_row] = '+'.join(reasons)
+                    pending[line_no] = []
+                    stopped[line_no] = False
+                    state.last_type = product_type
+                    state.last_mfg_width = data['mfg_width']
+                    if composition:
+                        state.last_composition = composition
+                elif order_code in tune_order_code:
+                    tune_reason = ''
+                    pending[line_no].append(row)
+                else:
+                    pending[line_no] = []
+                    stopped[line_no] = True
+                timeline['day'].append(day)
+                timeline['line'].append(line_no)
+                timeline['sequence'].append(sequence)
+                timeline['start_hour'].append(hour)
+                hour += data['hours']
+                timeline['end_hour'].append(hour)
+                timeline['order_code'].append(order_code)
+                timeline['product_code'].append(data['product_code'])
+                timeline['type'].append(_value(product_type))
+                timeline['composition'].append(_value(composition))
+                timeline['mfg_width'].append(data['mfg_width'])
+                timeline['tune_reason'].append(tune_reason)
+                row += 1
+    return timeline
+
+
+def check_timeline_file(timeline_file):
+    """Return the extension of a timeline file that can be written.
+
+    Raises ValueError for an unsupported extension and ImportError if the
+    format needs pyarrow and it is not installed.
+    """
+    extension = os.path.splitext(timeline_file)[1].lower()
+    if extension not in ('.parquet', '.feather', '.arrow', '.csv'):
+        raise ValueError('Timeline file should end with .parquet, .feather, .arrow or .csv: {}.'.format(timeline_file))
+    if extension != '.csv':
+        try:
+            importlib.import_module('pyarrow')
+        except ImportError:
+            raise ImportError('Writing {} files needs pyarrow (pip install pyarrow); use .csv without it.'.format(
+                extension)) from None
+    return extension
+
+
+def write_timeline(timeline, timeline_file):
+    """Write timeline columns to a Parquet (.parquet), Feather (.feather, .arrow) or CSV (.csv) file.
+
+    Parquet and Feather need pyarrow; CSV only the standard library.
+    """
+    extension = check_timeline_file(timeline_file)
+    if extension == '.csv':
+        with open(timeline_file, 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(timeline_columns)
+            writer.writerows(zip(*(timeline[name] for name in timeline_columns)))
+        return
+    import pyarrow as pa
+    schema = pa.schema([('day', pa.date32()), ('line', pa.string()), ('sequence', pa.int32()),
+                        ('start_hour', pa.int32()), ('end_hour', pa.int32()), ('order_code', pa.string()),
+                        ('product_code', pa.string()), ('type', pa.string()), ('composition', pa.string()),
+                        ('mfg_width', pa.int64()), ('tune_reason', pa.string())])
+    table = pa.table(timeline, schema=schema)
+    if extension == '.parquet':
+        import pyarrow.parquet as pq
+        pq.write_table(table, timeline_file)
+    else:
+        import pyarrow.feather as feather
+        feather.write_feather(table, timeline_file)
+
+
+def export_timeline(val, timeline_file):
+    """Write the timeline of a Validator's schedule if it passed; returns whether it was written.
+
+    A failed schedule has no timeline, so a file left at ``timeline_file`` by
+    an earlier run is removed rather than mistaken for this one's.
+    """
+    if not val.check_pass:
+        if os.path.exists(timeline_file):
+            os.remove(timeline_file)
+        return False
+    write_timeline(schedule_timeline(val.orders, val.data, val.plant), timeline_file)
+    return True
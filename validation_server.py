@@ -0,0 +1,240 @@
+#  Copyright (c) 2020 Industrial Technology Research Institute.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+import json
+import os
+import signal
+import socket
+import argparse
+
+_worker_orders = None
+_worker_plant = None
+
+
+def _init_server_worker(orders, plant):
+    global _worker_orders, _worker_plant
+    from shared_order_table import attach_orders
+    _worker_orders = {order_file: attach_orders(table) for order_file, table in orders.items()}
+    _worker_plant = plant
+
+
+def _error_result(msg, rule):
+    return {'check_pass': False, 'check_msg': msg,
+            'violations': [{'rule': rule, 'msg': msg, 'date': None, 'line_no': None, 'order_code': None}],
+            'metrics': None}
+
+
+def _serve_request(line):
+    """Parse one request line and validate it with the order tables of this worker."""
+    from validator import Validator, schedule_from_records
+    try:
+        request = json.loads(line)
+        if not isinstance(request, dict):
+            raise ValueError('A request should be a JSON object.')
+    except ValueError as e:
+        return _error_result(str(e), 'request')
+    order_file = request.get('order_file')
+    if order_file is not None and not isinstance(order_file, str):
+        return _error_result('"order_file" should be a path.', 'request')
+    order_file = os.path.abspath(order_file) if order_file is not None else next(iter(_worker_orders))
+    if order_file not in _worker_orders:
+        return _error_result('Order file is not loaded by the server: {}.'.format(order_file), 'order_file')
+    max_violations = request.get('max_violations', 1)
+    if max_violations is not None and (type(max_violations) is not int or max_violations < 0):
+        return _error_result('"max_violations" should be null, 0 (no limit) or a positive integer.', 'request')
+    if 'schedule' in request:
+        schedule = request['schedule']
+        if not isinstance(schedule, (dict, list)):
+            return _error_result('"schedule" should be a JSON object or a list of records.', 'request')
+    elif 'submit_file' in request:
+        schedule = request['submit_file']
+        if not isinstance(schedule, str):
+            return _error_result('"submit_file" should be a path.', 'request')
+    else:
+        return _error_result('A request should give "schedule" or "submit_file".', 'request')
+    try:
+        if isinstance(schedule, list):
+            schedule = schedule_from_records(schedule)
+        val = Validator(_worker_orders[order_file], schedule, request.get('start_date', '2019-07-01'),
+                        request.get('end_date', '2019-12-31'), max_violations or None,
+                        plant=_worker_plant)
+        val.validate_dates()
+        val.check_valid_schedule()
+    except Exception as e:
+        return _error_result(str(e), 'request')
+    return {'check_pass': val.check_pass, 'check_msg': val.check_msg,
+            'violations': [violation._asdict() for violation in val.violations], 'metrics': val.metrics}
+
+
+class ValidationServer:
+    """A long-running validator that answers requests over a local socket.
+
+    The order files and the plant are read and compiled once, when the server
+    starts, and handed to a pool of worker processes, so a request pays for
+    neither process start-up nor parsing the orders. The protocol is one JSON
+    object per line in each direction, over a Unix socket or a localhost TCP
+    port. A request names the schedule as ``submit_file`` (a JSON or binary
+    schedule path readable by the server) or sends it inline as ``schedule``,
+    and may give ``order_file`` (one of the preloaded files, the first by
+    default), ``start_date``, ``end_date`` and ``max_violations`` (None or 0
+    for no limit); an inline schedule may also be a list of records as accepted
+    by ``schedule_from_records``. The reply has ``check_pass``, ``check_msg``, ``violations``
+    and ``metrics``. Requests on one connection are answered in order;
+    separate connections are validated concurrently. With ``shared_orders``
+    the workers attach to memory-mapped order tables (see
+    shared_order_table.py) instead of each holding a copy.
+    """
+
+    def __init__(self, order_files, workers=None, plant=None, max_request_bytes=256 << 20, shared_orders=False):
+        from order_table import OrderTable
+        self.orders = {os.path.abspath(order_file): OrderTable.from_csv(order_file) for order_file in order_files}
+        self.workers = workers
+        self.plant = plant
+        self.max_request_bytes = max_request_bytes
+        self.shared_orders = shared_orders
+        self.pool = None
+
+    async def handle(self, reader, writer):
+        import asyncio
+        loop = asyncio.get_running_loop()
+        try:
+            while True:
+                try:
+                    line = await reader.readuntil(b'\n')
+                except asyncio.IncompleteReadError as e:
+                    line = e.partial
+                except asyncio.LimitOverrunError:
+                    writer.write(json.dumps(_error_result('Request is larger than the server accepts.',
+                                                          'request')).encode() + b'\n')
+                    break
+                if not line.strip():
+                    if reader.at_eof():
+                        break
+                    continue
+                result = await loop.run_in_executor(self.pool, _serve_request, line)
+                writer.write(json.dumps(result).encode() + b'\n')
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, socket_path=None, host='127.0.0.1', port=None):
+        """Serve on ``socket_path`` (Unix socket) or ``host:port`` until SIGTERM or cancelled."""
+        import asyncio
+        from concurrent.futures import ProcessPoolExecutor
+        from contextlib import ExitStack
+        from shared_order_table import shared_order_file
+        with ExitStack() as stack:
+            worker_orders = self.orders
+            if self.shared_orders:
+                worker_orders = {order_file: stack.enter_context(shared_order_file(table))
+                                 for order_file, table in self.orders.items()}
+            self.pool = stack.enter_context(ProcessPoolExecutor(self.workers, initializer=_init_server_worker,
+                                                                initargs=(worker_orders, self.plant)))
+            if socket_path:
+                if os.path.exists(socket_path):
+                    os.remove(socket_path)
+                server = await asyncio.start_unix_server(self.handle, socket_path, limit=self.max_request_bytes)
+            else:
+                server = await asyncio.start_server(self.handle, host, port, limit=self.max_request_bytes)
+            print('Serving {} on {}.'.format(', '.join(self.orders), socket_path or '{}:{}'.format(host, port)),
+                  flush=True)
+            asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, server.close)
+            try:
+                async with server:
+                    await server.serve_forever()
+            except asyncio.CancelledError:
+                pass
+            finally:
+                if socket_path and os.path.exists(socket_path):
+                    os.remove(socket_path)
+
+
+def connect(address, timeout=None):
+    """Open a connection to a ValidationServer at a Unix socket path or a (host, port) pair."""
+    if isinstance(address, str):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(timeout)
+        sock.connect(address)
+        return sock
+    return socket.create_connection(address, timeout)
+
+
+def request_validation(address, submit_file=None, start_date='2019-07-01', end_date='2019-12-31', max_violations=1,
+                       order_file=None, schedule=None, timeout=None):
+    """Validate a submission on a running ValidationServer and return the reply dict.
+
+    ``submit_file`` is sent as an absolute path; pass ``schedule`` to send the
+    schedule itself instead. Only the standard library is used, so a client
+    starts quickly.
+    """
+    request = {'start_date': start_date, 'end_date': end_date, 'max_violations': max_violations}
+    if schedule is not None:
+        request['schedule'] = schedule
+    else:
+        request['submit_file'] = os.path.abspath(submit_file)
+    if order_file is not None:
+        request['order_file'] = os.path.abspath(order_file)
+    with connect(address, timeout) as sock:
+        sock.sendall(json.dumps(request).encode() + b'\n')
+        sock.shutdown(socket.SHUT_WR)
+        with sock.makefile('rb') as f:
+            return json.loads(f.readline())
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser("validation_server")
+    parser.add_argument("--serve", action='store_true', help="run the server (otherwise send one request to it)")
+    parser.add_argument("--socket", default=None, type=str, help="Unix socket path to serve on or connect to")
+    parser.add_argument("--host", default='127.0.0.1', type=str)
+    parser.add_argument("--port", default=None, type=int, help="localhost TCP port, when --socket is not given")
+    parser.add_argument("--order_file", default=None, type=str, action='append',
+                        help="order file to preload (repeatable; server) or to validate against (client)")
+    parser.add_argument("--workers", default=None, type=int, help="number of worker processes")
+    parser.add_argument("--plant", default=None, type=str, help="plant model file (see plant_model.py)")
+    parser.add_argument("--max_request_mb", default=256, type=int, help="largest request the server accepts")
+    parser.add_argument("--shared_orders", action='store_true',
+                        help="workers attach to memory-mapped order tables instead of each holding a copy")
+    parser.add_argument("--submit_file", default='submission_example.json', type=str)
+    parser.add_argument("--start_date", default='2019-07-01', type=str)
+    parser.add_argument("--end_date", default='2019-12-31', type=str)
+    parser.add_argument("--max_violations", default=1, type=int,
+                        help="keep validating until this many violations are found (0 for no limit)")
+    args = parser.parse_args()
+    if not args.socket and not args.port:
+        parser.error('one of --socket or --port is required')
+    address = args.socket or (args.host, args.port)
+    if args.serve:
+        import asyncio
+        from plant_model import PlantModel
+        plant = PlantModel.load(args.plant) if args.plant else None
+        server = ValidationServer(args.order_file or ['orders_2019.csv'], args.workers, plant,
+                                  args.max_request_mb << 20, args.shared_orders)
+        try:
+            asyncio.run(server.serve(args.socket, args.host, args.port))
+        except KeyboardInterrupt:
+            pass
+    else:
+        if args.order_file and len(args.order_file) > 1:
+            parser.error('a request is validated against one --order_file')
+        if args.max_violations < 0:
+            parser.error('--max_violations should be 0 (no limit) or positive')
+        result = request_validation(address, args.submit_file, args.start_date, args.end_date,
+                                    args.max_violations or None, args.order_file[0] if args.order_file else None)
+        if len(result['violations']) > 1:
+            for violation in result['violations']:
+                print('[{}] {}'.format(violation['rule'], violation['msg']))
+        else:
+            print(result['check_msg'])
@@ -12,345 +12,818 @@
 #  See the License for the specific language governing permissions and
 #  limitations under the License.
 
-import datetime
+import csv
+import glob
 import json
+import os
 import argparse
-import pandas as pd
-from query_table import valid_prod_no, valid_prod_line, valid_keys, valid_k_line, \
-    width_constraint, type_transition, composition_transition, tune_hour_state, code_type_transition, \
-    state_transition, special_order_code, initial_state, mfg_transition
+from collections import namedtuple
+from collections.abc import Mapping
+from contextlib import nullcontext
+from calendar_index import CalendarIndex
+from order_table import OrderTable, date_ordinal
+from line_state import new_line_states
+from plant_model import PlantModel, default_plant
+from rule_profile import RuleProfile
+from query_table import valid_keys, special_order_code, tune_order_code
 
 
-def handle_validation_errors(obj, msg):
+Violation = namedtuple('Violation', ['rule', 'msg', 'date', 'line_no', 'order_code'])
+Evaluation = namedtuple('Evaluation', ['check_pass', 'check_msg', 'violations', 'metrics'])
+# First bytes of a binary schedule file (see schedule_binary.py).
+binary_schedule_magic = b'CTSPSCH1'
+
+
+def handle_validation_errors(obj, msg, rule=None, date=None, line_no=None, order_code=None):
     """Wrap validation errors.
+
+    ``check_msg`` keeps the first violation; every violation is appended to ``violations``.
     """
-    obj.check_pass = False
-    obj.check_msg = msg
+    if obj.check_pass:
+        obj.check_pass = False
+        obj.check_msg = msg
+    obj.violations.append(Violation(rule, msg, date, line_no, order_code))
     return obj.check_pass, obj.check_msg
 
 
-def generate_date_list(start_date, end_date):
-    date_list = []
-    end_date = end_date + datetime.timedelta(1)
-    for n in range(int((end_date - start_date).days)):
-        date_list.append((start_date + datetime.timedelta(n)).strftime('%Y-%m-%d'))
-    return date_list
+def check_max_violations(max_violations):
+    """Raise ValueError unless ``max_violations`` is None (no limit) or a positive integer."""
+    if max_violations is not None and (type(max_violations) is not int or max_violations < 1):
+        raise ValueError('max_violations should be None or a positive integer: {!r}.'.format(max_violations))
 
 
-class DatetimeRange:
-    def __init__(self, dt1, dt2):
-        self._dt1 = dt1
-        self._dt2 = dt2
+def new_metrics():
+    """Objective metrics gathered while checking a schedule.
 
-    def __contains__(self, dt):
-        """Check if the date is in valid date range"""
-        return self._dt1 <= dt <= self._dt2
+    tune_8_hours, tune_48_hours and stop_hours sum the hours of those items and
+    open_line_days counts the (date, line) pairs with anything but "stop".
+    """
+    return {'tune_8_hours': 0, 'tune_48_hours': 0, 'stop_hours': 0, 'open_line_days': 0}
+
+
+class ScheduleState:
+    """State accumulated while walking a schedule day by day."""
+
+    def __init__(self, lines=None, calendar=None, plant=None):
+        self.line_states = new_line_states(lines, plant)
+        self.calendar = calendar
+        self.order_set = set()
+        self.amount_dict = {}
+        self.metrics = new_metrics()
+        self.date = None
+        self.prod_date = None
+        self.date_error = None
+        self.line_per_day = []
+        self.open_line_per_day = set()
+
+    def start_day(self, date):
+        self.date = date
+        try:
+            self.prod_date = self.calendar.ordinal(date) if self.calendar else date_ordinal(date)
+            self.date_error = None
+        except Exception as e:
+            self.prod_date = None
+            self.date_error = str(e)
+        self.line_per_day = []
+        self.open_line_per_day = set()
 
 
 class Validator:
     """Validate submission file"""
 
-    def __init__(self, order_file, json_file, start_date, end_date):
+    def __init__(self, order_file, json_file, start_date, end_date, max_violations=1, profile=None, plant=None):
+        """``order_file`` is a path to the order CSV or an already compiled OrderTable.
+        ``json_file`` is a path to the submission (JSON or binary schedule) or
+        the schedule mapping itself.
+
+        By default validation stops at the first violation. With a larger
+        ``max_violations`` (None for no limit) it keeps going and records every
+        violation in ``violations`` until the budget is spent. Any other
+        value than None or a positive integer raises ValueError.
+
+        Pass a RuleProfile as ``profile`` to record the load time and the call
+        counts and time of each rule group, and a PlantModel as ``plant`` to
+        check against another plant than the one in query_table.py.
+        """
+        check_max_violations(max_violations)
+        self.check_pass = True
+        self.check_msg = 'Submission file is valid.'
+        self.violations = []
+        self.max_violations = max_violations
+        self.metrics = new_metrics()
+        self.profile = profile
+        self.plant = plant or default_plant()
+
         # 1. Check for JSON format.
-        try:
-            with open(json_file) as f:
-                self.data = json.load(f)
-                self.check_pass = True
-                self.check_msg = 'Submission file is valid.'
-        except Exception as e:
-            self.data = None
-            self.check_pass = False
-            self.check_msg = str(e)
+        if isinstance(json_file, Mapping):
+            self.data = json_file
+        else:
+            if profile:
+                profile.enter('load_json')
+            try:
+                with open(json_file, 'rb') as f:
+                    is_binary = f.read(len(binary_schedule_magic)) == binary_schedule_magic
+                if is_binary:
+                    from schedule_binary import BinarySchedule
+                    self.data = BinarySchedule(json_file)
+                else:
+                    with open(json_file) as f:
+                        self.data = json.load(f)
+                    if not isinstance(self.data, dict):
+                        raise ValueError('Submission should be a JSON object of dates.')
+            except Exception as e:
+                self.data = None
+                handle_validation_errors(self, str(e), 'json_format')
+            if profile:
+                profile.stop()
 
         self.start_date = start_date
         self.end_date = end_date
+        try:
+            self.calendar = CalendarIndex(start_date, end_date)
+        except Exception as e:
+            self.calendar = None
+            handle_validation_errors(self, str(e), 'date_range')
 
+        if profile and not isinstance(order_file, OrderTable):
+            profile.enter('load_csv')
         try:
-            self.order_df = pd.read_csv(order_file, index_col='order_code')  # Get order information
+            if isinstance(order_file, OrderTable):
+                self.orders = order_file
+            else:
+                self.orders = OrderTable.from_csv(order_file)  # Get order information
         except Exception as e:
-            self.order_df = None
-            self.check_pass = False
-            self.check_msg = str(e)
+            self.orders = None
+            handle_validation_errors(self, str(e), 'order_file')
+        if profile:
+            profile.stop()
+
+    def stop_checking(self):
+        """Whether the violation budget is spent."""
+        return self.max_violations is not None and len(self.violations) >= self.max_violations
+
+    def can_check(self):
+        """Whether the submission and order file are loaded and the budget allows checking."""
+        return self.data is not None and self.orders is not None and self.calendar is not None and \
+            not self.stop_checking()
 
     def validate_dates(self):
         """2. Check the scheduled date is valid."""
-        tmp_date = None
-        if self.check_pass:
-            for date, v in self.data.items():
-                try:
-                    datetime.datetime.strptime(date, '%Y-%m-%d')
-                except ValueError:
-                    msg = '{}: Wrong datetime format.'.format(date)
-                    return handle_validation_errors(self, msg)
-
-                current_date = datetime.datetime.strptime(date, '%Y-%m-%d')
-                start_date = datetime.datetime.strptime(self.start_date, '%Y-%m-%d')
-                end_date = datetime.datetime.strptime(self.end_date, '%Y-%m-%d')
+        if self.profile:
+            self.profile.enter('dates')
+        try:
+            previous = None
+            if self.can_check():
+                for date in self.data:
+                    previous = self.check_date(date, previous)
+                    if self.stop_checking():
+                        return self.check_pass, self.check_msg
+
+                if not all(date in self.data for date in self.calendar.days):
+                    msg = 'Not all dates are included.'
+                    return handle_validation_errors(self, msg, 'date_missing')
+            return self.check_pass, self.check_msg
+        finally:
+            if self.profile:
+                self.profile.stop()
+
+    def check_date(self, date, previous):
+        """Check the format, range and order of one scheduled date.
+
+        ``previous`` is the ``(date, day)`` of the last well-formed date before it,
+        and the one to compare the next date with is returned.
+        """
+        calendar = self.calendar
+        try:
+            current_day = calendar.ordinal(date)
+        except ValueError:
+            msg = '{}: Wrong datetime format.'.format(date)
+            handle_validation_errors(self, msg, 'date_format', date)
+            return previous
+
+        if current_day not in calendar:
+            msg = 'Scheduled date is not in valid range. ({} to {})'.format(self.start_date, self.end_date)
+            handle_validation_errors(self, msg, 'date_range', date)
+            if self.stop_checking():
+                return previous
+
+        if previous and current_day < previous[1]:
+            msg = '{}, {}: Wrong date order.'.format(date, previous[0])
+            handle_validation_errors(self, msg, 'date_order', date)
+        return date, current_day
 
-                if current_date not in DatetimeRange(start_date, end_date):
-                    msg = 'Scheduled date is not in valid range. ({} to {})'.format(self.start_date, self.end_date)
-                    return handle_validation_errors(self, msg)
+    def check_valid_schedule(self):
+        run = ScheduleState(calendar=self.calendar, plant=self.plant)
+        self.metrics = run.metrics
+        try:
+            if self.can_check():
+                for date, lines in self.data.items():
+                    self.check_day(run, date, lines)
+                    if self.stop_checking():
+                        return self.check_pass, self.check_msg
+                self.check_orders(run)
+            return self.check_pass, self.check_msg
+        finally:
+            if self.profile:
+                self.profile.stop()
+
+    def check_day(self, run, date, lines):
+        """Run checks 3-9 on the schedule of one day."""
+        run.start_day(date)
+        if not isinstance(lines, dict):
+            msg = '{}: Scheduled production lines should be an object.'.format(date)
+            return handle_validation_errors(self, msg, 'line_items', date)
+        for line_no, line_data in lines.items():
+            run.line_per_day.append(line_no)
+            self.check_line_day(run, line_no, line_data)
+            if self.stop_checking():
+                return self.check_pass, self.check_msg
+        run.metrics['open_line_days'] += len(run.open_line_per_day)
+
+        #  9. Check if the number of opened production lines are between 2~6.
+        if self.profile:
+            self.profile.enter('line_count')
+        open_lines = self.plant.open_lines
+        if set(run.line_per_day) != self.plant.line_set:
+            msg = 'Missing schedule for some production lines.'
+            handle_validation_errors(self, msg, 'line_missing', date)
+            if self.stop_checking():
+                return self.check_pass, self.check_msg
+        if len(run.open_line_per_day) not in open_lines:
+            msg = 'The number of open production lines should be between {} and {}.'.format(open_lines[0],
+                                                                                              open_lines[-1])
+            return handle_validation_errors(self, msg, 'open_lines', date)
+        return self.check_pass, self.check_msg
 
-                if not tmp_date:
-                    tmp_date = date
-                else:
-                    if datetime.datetime.strptime(date, '%Y-%m-%d') < datetime.datetime.strptime(tmp_date, '%Y-%m-%d'):
-                        msg = '{}, {}: Wrong date order.'.format(date, tmp_date)
-                        return handle_validation_errors(self, msg)
-                    tmp_date = date
-
-            valid_date = generate_date_list(start_date, end_date)
-            if not all(list(i in list(self.data.keys()) for i in valid_date)):
-                msg = 'Not all dates are included.'
-                return handle_validation_errors(self, msg)
+    def check_line_day(self, run, line_no, line_data):
+        """Run checks 3-8 on the items of one production line on the current day of ``run``."""
+        date = run.date
+        prof = self.profile
+        if prof:
+            prof.enter('lines')
+
+        # 3. Check for production lines.
+        if line_no not in self.plant.line_bit:
+            msg = '{}, {}: Wrong production lines.'.format(date, line_no)
+            return handle_validation_errors(self, msg, 'line_name', date, line_no)
+        if not isinstance(line_data, list):
+            msg = '{}, {}: Scheduled items should be a list.'.format(date, line_no)
+            return handle_validation_errors(self, msg, 'line_items', date, line_no)
+        if len(line_data) == 0:
+            msg = '{}, {}: Scheduled items should not be empty.'.format(date, line_no)
+            return handle_validation_errors(self, msg, 'line_items', date, line_no)
+
+        state = run.line_states[line_no]
+        cul_hours = 0
+        for data in line_data:
+            violations = len(self.violations)
+            tune_hours = state.tune_hours
+            self.check_item(run, state, line_no, data)
+            if prof:
+                prof.enter('lines', 0)
+            if len(self.violations) > violations:
+                if self.stop_checking():
+                    return self.check_pass, self.check_msg
+                cul_hours += self.recover_item(run, state, line_no, data, tune_hours)
+                continue
+            cul_hours += data['hours']
+            if data['order_code'] in special_order_code:
+                run.metrics[data['order_code'] + '_hours'] += data['hours']
+            state.last_code = data['order_code']
+
+        header = '{},{}: '.format(date, line_no)
+        if cul_hours != 24:
+            msg = header + 'Working hours should be equal to 24 per day.'
+            return handle_validation_errors(self, msg, 'day_hours', date, line_no)
         return self.check_pass, self.check_msg
 
-    def check_valid_schedule(self):
-        init_count = 0
-        order_set = set()
-        amount_dict = {}
-        if self.check_pass:
-            for date, lines in self.data.items():
-                line_per_day = []
-                open_line_per_day = set()
-                init_count = init_count + 1
-                for line_no, line_data in lines.items():
-                    line_per_day.append(line_no)
-
-                    # 3. Check for production lines.
-                    if line_no not in valid_prod_line:
-                        msg = '{}, {}: Wrong production lines.'.format(date, line_no)
-                        return handle_validation_errors(self, msg)
-                    if not isinstance(line_data, list):
-                        msg = '{}, {}: Scheduled items should be a list.'.format(date, line_no)
-                        return handle_validation_errors(self, msg)
-                    if len(line_data) == 0:
-                        msg = '{}, {}: Scheduled items should not be empty.'.format(date, line_no)
-                        return handle_validation_errors(self, msg)
-
-                    cul_hours = 0
-                    for data in line_data:
-                        type_change = False
-                        df_composition = None
-                        header = '{},{}: '.format(date, line_no)
-                        #  4. Check for order code, product code, hours and mfg_width.
-                        if set(valid_keys) != set(data.keys()):
-                            msg = header + 'Some keys are missing in {}.'.format(valid_keys)
-                            return handle_validation_errors(self, msg)
-
-                        header = '{},{},{}: '.format(date, line_no, data['order_code'])
-                        if not isinstance(data['order_code'], str):
-                            msg = header + '"order_code" is not string.'
-                            return handle_validation_errors(self, msg)
-                        if data['order_code'] not in special_order_code + self.order_df.index.tolist():
-                            msg = header + 'Invalid "order_code".'
-                            return handle_validation_errors(self, msg)
-                        if data['order_code'] not in special_order_code:
-                            order_set.add(data['order_code'])
-                        if not isinstance(data['product_code'], str):
-                            msg = header + '"product_code" is not string.'
-                            return handle_validation_errors(self, msg)
-                        if data['product_code'] not in valid_prod_no and data['product_code'] not in special_order_code:
-                            msg = header + 'Invalid "product_code".'
-                            return handle_validation_errors(self, msg)
-                        if not isinstance(data['hours'], int):
-                            msg = header + '"hours" is not integer.'
-                            return handle_validation_errors(self, msg)
-                        if data['hours'] < 0:
-                            msg = header + 'Invalid "hours".'
-                            return handle_validation_errors(self, msg)
-                        if not isinstance(data['mfg_width'], int):
-                            msg = header + '"mfg_width" is not integer.'
-                            return handle_validation_errors(self, msg)
-                        if data['mfg_width'] < 0:
-                            msg = header + 'Invalid "mfg_width".'
-                            return handle_validation_errors(self, msg)
-                        # 5. Check for date constraints.
-                        code_type_transition[line_no].append(data['order_code'])
-                        if data['order_code'] != 'stop':
-                            open_line_per_day.add(line_no)
-                            if data['order_code'] not in special_order_code:
-                                if len(code_type_transition[line_no]) > 0:
-                                    if len(code_type_transition[line_no]) == 1 or code_type_transition[line_no][-2] == 'stop':
-                                        msg = header + 'You should tune the machine (tune_8 or tune_48) before start.'
-                                        return handle_validation_errors(self, msg)
-                                if self.order_df.loc[data['order_code'], 'product_code'] != data['product_code']:
-                                    msg = header + 'Mismatched "order_code" and "product_code".'
-                                    return handle_validation_errors(self, msg)
-                                tune_hours = tune_hour_state[line_no]
-                                tune_hour_state[line_no] = 0
-                                try:
-                                    not_before = datetime.datetime.strptime(
-                                        self.order_df.loc[data['order_code'], 'not_before'].split('T')[0], '%Y-%m-%d')
-                                    not_after = datetime.datetime.strptime(
-                                        self.order_df.loc[data['order_code'], 'not_after'].split('T')[0], '%Y-%m-%d')
-                                    prod_date = datetime.datetime.strptime(date, '%Y-%m-%d')
-                                    if prod_date not in DatetimeRange(not_before, not_after):
-                                        msg = header + 'Production schedule is out of range.'
-                                        return handle_validation_errors(self, msg)
-                                except Exception as e:
-                                    msg = str(e)
-                                    return handle_validation_errors(self, msg)
-
-                                df_code = self.order_df.loc[data['order_code'], 'material']
-                                df_composition = self.order_df.loc[data['order_code'], 'composition']
-                                #     6. Check for production line constraints.
-                                if df_code == 'MS':
-                                    if line_no != 'C1':
-                                        msg = header + 'Invalid line assignment for MS material.'
-                                        return handle_validation_errors(self, msg)
-                                if 'K' in data['product_code']:
-                                    if line_no not in valid_k_line:
-                                        msg = header + 'Invalid line assignment for product code starting with K.'
-                                        return handle_validation_errors(self, msg)
-
-                                # 7. Check for width constraints.
-                                try:
-                                    product_type = self.order_df.loc[data['order_code'], 'type']
-                                    width = self.order_df.loc[data['order_code'], 'width']
-                                    type_transition[line_no].append(product_type)
-                                    if not width_constraint[line_no]['max_mfg_width'].get(product_type, None):
-                                        msg = header + 'Mismatched "type: {}" and "line: {}".'.format(product_type, line_no)
-                                        return handle_validation_errors(self, msg)
-                                    if data['mfg_width'] > width_constraint[line_no]['max_mfg_width'][product_type]:
-                                        msg = header + '"mfg_width" exceeds production limit.'
-                                        return handle_validation_errors(self, msg)
-                                    if width > width_constraint[line_no]['max_width'][product_type]:
-                                        msg = header + '"width" exceeds production limit.'
-                                        return handle_validation_errors(self, msg)
-                                    if product_type == 'lenti' and (data['mfg_width'] - width) < 70:
-                                        msg = header + '"mfg_width" should be at least 70mm wider than "width" for type "lenti".'
-                                        return handle_validation_errors(self, msg)
-                                    elif product_type == 'plate' and (data['mfg_width'] - width) < 50:
-                                        msg = header + '"mfg_width" should be at least 50mm wider than "width" for type "plate".'
-                                        return handle_validation_errors(self, msg)
-                                except Exception as e:
-                                    msg = str(e)
-                                    return handle_validation_errors(self, msg)
-
-                                last_type = initial_state[line_no]
-                                if len(type_transition[line_no]) > 1:
-                                    type_list = type_transition[line_no]
-                                    last_type = type_list[-2]
-
-                                """  8. Check if the machine of specific production line restart while:
-                                         a. The type of product changed. (tune for 48 hours)
-                                """
-
-                                if last_type and last_type != product_type:
-                                    type_change = True
-                                    if code_type_transition[line_no][-2] != 'tune_48' or tune_hours != 48:
-                                        msg = header + 'Type changed, you should tune the machine for 48 hours (tune_48).'
-                                        return handle_validation_errors(self, msg)
-
-                                """  8. Check if the machine of specific production line restart while:
-                                         b. The composition of product changed from 8% or 100% to 0%. (tune for 8 hours)
-                                """
-                                last_composition = None
-                                last_state = None
-                                if len(state_transition[line_no]) > 0:
-                                    last_state = state_transition[line_no][-1]
-                                if len(composition_transition[line_no]) > 0:
-                                    last_composition = composition_transition[line_no][-1]
-                                if last_composition and last_composition != '0%':
-                                    if df_composition and df_composition == '0%':
-                                        valid_state = 'tune_8'
-                                        valid_tune_hours = 8
-                                        if type_change:
-                                            valid_state = 'tune_48'
-                                            valid_tune_hours = 48
-                                        if last_state != valid_state or tune_hours != valid_tune_hours:
-                                            msg = header + 'Composition changed to 0%, you should tune the machine for {} hours. ({})'.format(
-                                                valid_tune_hours, valid_state)
-                                            return handle_validation_errors(self, msg)
-
-                                if len(mfg_transition[line_no]) > 0:
-                                    valid_tune_state = 'tune_8'
-                                    valid_tune_hours = 8
-                                    if type_change:
-                                        valid_tune_state = 'tune_48'
-                                        valid_tune_hours = 48
-                                    if data['mfg_width'] != mfg_transition[line_no][-1]:
-                                        if last_state != valid_tune_state or tune_hours != valid_tune_hours:
-                                            msg = header + '"mfg_width" changed, you should tune the machine for {} hours. ({})'.format(
-                                                valid_tune_hours, valid_tune_state)
-                                            return handle_validation_errors(self, msg)
-                                mfg_transition[line_no].append(data['mfg_width'])
-
-                                # Calculate production quantity for each order
-                                amount_dict[data['order_code']] = data['hours'] * 125 + amount_dict.get(
-                                    data['order_code'], 0)
-
-                            elif data['order_code'] == 'tune_8':
-                                if data['product_code'] != 'tune_8':
-                                    msg = header + 'Mismatched "order_code" and "product_code".'
-                                    return handle_validation_errors(self, msg)
-                                if len(code_type_transition[line_no]) > 1 and code_type_transition[line_no][-2] == 'tune_48':
-                                    msg = header + '"tune_48" cannot be followed by "tune_8".'
-                                    return handle_validation_errors(self, msg)
-                                if data['hours'] > 8:
-                                    msg = header + 'Invalid tune hours for "tune_8".'
-                                    return handle_validation_errors(self, msg)
-                                tune_hour_state[line_no] += data['hours']
-                                if tune_hour_state[line_no] > 8:
-                                    msg = header + 'You cannot tune more than 8 hours for "tune_8".'
-                                    return handle_validation_errors(self, msg)
-                            elif data['order_code'] == 'tune_48':
-                                if data['product_code'] != 'tune_48':
-                                    msg = header + 'Mismatched "order_code" and "product_code".'
-                                    return handle_validation_errors(self, msg)
-                                if len(code_type_transition[line_no]) > 1 and code_type_transition[line_no][-2] == 'tune_8':
-                                    msg = header + '"tune_8" cannot be followed by "tune_48".'
-                                    return handle_validation_errors(self, msg)
-                                if data['hours'] > 24:
-                                    msg = header + 'Invalid tune hours for "tune_48".'
-                                    return handle_validation_errors(self, msg)
-                                tune_hour_state[line_no] += data['hours']
-                                if tune_hour_state[line_no] > 48:
-                                    msg = header + 'You cannot tune more than 48 hours for "tune_48".'
-                                    return handle_validation_errors(self, msg)
-
-                        cul_hours += data['hours']
-                        state_transition[line_no].append(data['order_code'])
-                        if df_composition:
-                            composition_transition[line_no].append(df_composition)
-
-                    header = '{},{}: '.format(date, line_no)
-                    if cul_hours != 24:
-                        msg = header + 'Working hours should be equal to 24 per day.'
-                        return handle_validation_errors(self, msg)
-                #  9. Check if the number of opened production lines are between 2~6.
-                if set(line_per_day) != set(valid_prod_line):
-                    msg = 'Missing schedule for some production lines.'
-                    return handle_validation_errors(self, msg)
-                if len(open_line_per_day) not in range(2, 7):
-                    msg = 'The number of open production lines should be between 2 and 6.'
-                    return handle_validation_errors(self, msg)
-
-            order_in_range = self.order_df
-
-            #  10. Check if all orders are included.
-            if order_set != set(order_in_range.index):
-                msg = 'Not all order are included.'
-                return handle_validation_errors(self, msg)
-
-            #  11. Check if the product amount is valid.
-            for order, amount in amount_dict.items():
-                if amount != order_in_range.loc[order, 'quantity']:
-                    msg = 'Wrong production quantity for order: {}.'.format(order)
-                    return handle_validation_errors(self, msg)
+    def check_item(self, run, state, line_no, data):
+        """Run checks 4-8 on one scheduled item, stopping at its first violation."""
+        date = run.date
+        prod_date = run.prod_date
+        date_error = run.date_error
+        orders = self.orders
+        order_index = orders.index
+        order_set = run.order_set
+        amount_dict = run.amount_dict
+        open_line_per_day = run.open_line_per_day
+        plant = self.plant
+        prof = self.profile
+        if prof:
+            prof.enter('fields')
+
+        type_change = False
+        header = '{},{}: '.format(date, line_no)
+        #  4. Check for order code, product code, hours and mfg_width.
+        if not isinstance(data, dict):
+            msg = header + 'Scheduled item should be an object.'
+            return handle_validation_errors(self, msg, 'item_keys', date, line_no)
+        if set(valid_keys) != set(data.keys()):
+            msg = header + 'Some keys are missing in {}.'.format(valid_keys)
+            return handle_validation_errors(self, msg, 'item_keys', date, line_no)
+
+        order_code = data['order_code']
+        header = '{},{},{}: '.format(date, line_no, order_code)
+        if not isinstance(data['order_code'], str):
+            msg = header + '"order_code" is not string.'
+            return handle_validation_errors(self, msg, 'order_code', date, line_no, order_code)
+        row = order_index.get(data['order_code'])
+        if row is None and data['order_code'] not in special_order_code:
+            msg = header + 'Invalid "order_code".'
+            return handle_validation_errors(self, msg, 'order_code', date, line_no, order_code)
+        if row is not None:
+            order_set.add(data['order_code'])
+        if not isinstance(data['product_code'], str):
+            msg = header + '"product_code" is not string.'
+            return handle_validation_errors(self, msg, 'product_code', date, line_no, order_code)
+        if data['product_code'] not in plant.product_lines and data['product_code'] not in special_order_code:
+            msg = header + 'Invalid "product_code".'
+            return handle_validation_errors(self, msg, 'product_code', date, line_no, order_code)
+        if not isinstance(data['hours'], int):
+            msg = header + '"hours" is not integer.'
+            return handle_validation_errors(self, msg, 'hours', date, line_no, order_code)
+        if data['hours'] < 0:
+            msg = header + 'Invalid "hours".'
+            return handle_validation_errors(self, msg, 'hours', date, line_no, order_code)
+        if not isinstance(data['mfg_width'], int):
+            msg = header + '"mfg_width" is not integer.'
+            return handle_validation_errors(self, msg, 'mfg_width', date, line_no, order_code)
+        if data['mfg_width'] < 0:
+            msg = header + 'Invalid "mfg_width".'
+            return handle_validation_errors(self, msg, 'mfg_width', date, line_no, order_code)
+        # 5. Check for date constraints.
+        if prof:
+            prof.enter('date_window')
+        last_code = state.last_code
+        if data['order_code'] != 'stop':
+            open_line_per_day.add(line_no)
+            if row is not None:
+                if last_code is None or last_code == 'stop':
+                    msg = header + 'You should tune the machine (tune_8 or tune_48) before start.'
+                    return handle_validation_errors(self, msg, 'tune_before_start', date, line_no, order_code)
+                if orders.product_code[row] != data['product_code']:
+                    msg = header + 'Mismatched "order_code" and "product_code".'
+                    return handle_validation_errors(self, msg, 'product_mismatch', date, line_no, order_code)
+                tune_hours = state.tune_hours
+                state.tune_hours = 0
+                if row in orders.date_errors:
+                    return handle_validation_errors(self, orders.date_errors[row], 'order_dates', date, line_no, order_code)
+                if date_error:
+                    return handle_validation_errors(self, date_error, 'date_format', date, line_no, order_code)
+                if not orders.not_before[row] <= prod_date <= orders.not_after[row]:
+                    msg = header + 'Production schedule is out of range.'
+                    return handle_validation_errors(self, msg, 'date_window', date, line_no, order_code)
+
+                df_code = orders.material[row]
+                df_composition = orders.composition[row]
+                #     6. Check for production line constraints.
+                if prof:
+                    prof.enter('line_constraints')
+                line_bit = plant.line_bit[line_no]
+                material_lines = plant.material_lines.get(df_code)
+                if material_lines is not None and not material_lines & line_bit:
+                    msg = header + 'Invalid line assignment for {} material.'.format(df_code)
+                    return handle_validation_errors(self, msg, 'ms_line', date, line_no, order_code)
+                if not plant.product_lines.get(data['product_code'], line_bit) & line_bit:
+                    msg = header + 'Invalid line assignment for product code starting with K.'
+                    return handle_validation_errors(self, msg, 'k_line', date, line_no, order_code)
+
+                # 7. Check for width constraints.
+                if prof:
+                    prof.enter('width')
+                try:
+                    product_type = orders.type[row]
+                    width = orders.width[row]
+                    limits = plant.width_limits.get((line_no, product_type))
+                    if limits is None:
+                        msg = header + 'Mismatched "type: {}" and "line: {}".'.format(product_type, line_no)
+                        return handle_validation_errors(self, msg, 'line_type', date, line_no, order_code)
+                    max_mfg_width, max_width = limits
+                    if data['mfg_width'] > max_mfg_width:
+                        msg = header + '"mfg_width" exceeds production limit.'
+                        return handle_validation_errors(self, msg, 'max_mfg_width', date, line_no, order_code)
+                    if width > max_width:
+                        msg = header + '"width" exceeds production limit.'
+                        return handle_validation_errors(self, msg, 'max_width', date, line_no, order_code)
+                    margin = plant.width_margin.get(product_type)
+                    if margin is not None and (data['mfg_width'] - width) < margin:
+                        msg = header + '"mfg_width" should be at least {}mm wider than "width" for type "{}".'.format(
+                            margin, product_type)
+                        return handle_validation_errors(self, msg, 'width_margin', date, line_no, order_code)
+                except Exception as e:
+                    msg = str(e)
+                    return handle_validation_errors(self, msg, 'width', date, line_no, order_code)
+
+                if prof:
+                    prof.enter('tune')
+                last_type = state.last_type
+                state.last_type = product_type
+
+                """  8. Check if the machine of specific production line restart while:
+                         a. The type of product changed. (tune for 48 hours)
+                """
+
+                if last_type and last_type != product_type:
+                    type_change = True
+                    if last_code != 'tune_48' or tune_hours != 48:
+                        msg = header + 'Type changed, you should tune the machine for 48 hours (tune_48).'
+                        return handle_validation_errors(self, msg, 'tune_type', date, line_no, order_code)
+
+                """  8. Check if the machine of specific production line restart while:
+                         b. The composition of product changed from 8% or 100% to 0%. (tune for 8 hours)
+                """
+                last_composition = state.last_composition
+                if last_composition and last_composition != '0%':
+                    if df_composition and df_composition == '0%':
+                        valid_state = 'tune_8'
+                        valid_tune_hours = 8
+                        if type_change:
+                            valid_state = 'tune_48'
+                            valid_tune_hours = 48
+                        if last_code != valid_state or tune_hours != valid_tune_hours:
+                            msg = header + 'Composition changed to 0%, you should tune the machine for {} hours. ({})'.format(
+                                valid_tune_hours, valid_state)
+                            return handle_validation_errors(self, msg, 'tune_composition', date, line_no, order_code)
+
+                if state.last_mfg_width is not None:
+                    valid_tune_state = 'tune_8'
+                    valid_tune_hours = 8
+                    if type_change:
+                        valid_tune_state = 'tune_48'
+                        valid_tune_hours = 48
+                    if data['mfg_width'] != state.last_mfg_width:
+                        if last_code != valid_tune_state or tune_hours != valid_tune_hours:
+                            msg = header + '"mfg_width" changed, you should tune the machine for {} hours. ({})'.format(
+                                valid_tune_hours, valid_tune_state)
+                            return handle_validation_errors(self, msg, 'tune_mfg_width', date, line_no, order_code)
+                state.last_mfg_width = data['mfg_width']
+
+                # Calculate production quantity for each order
+                amount_dict[data['order_code']] = data['hours'] * 125 + amount_dict.get(
+                    data['order_code'], 0)
+                if df_composition:
+                    state.last_composition = df_composition
+
+            elif data['order_code'] == 'tune_8':
+                if prof:
+                    prof.enter('tune')
+                if data['product_code'] != 'tune_8':
+                    msg = header + 'Mismatched "order_code" and "product_code".'
+                    return handle_validation_errors(self, msg, 'product_mismatch', date, line_no, order_code)
+                if last_code == 'tune_48':
+                    msg = header + '"tune_48" cannot be followed by "tune_8".'
+                    return handle_validation_errors(self, msg, 'tune_sequence', date, line_no, order_code)
+                if data['hours'] > 8:
+                    msg = header + 'Invalid tune hours for "tune_8".'
+                    return handle_validation_errors(self, msg, 'tune_8_hours', date, line_no, order_code)
+                state.tune_hours += data['hours']
+                if state.tune_hours > 8:
+                    msg = header + 'You cannot tune more than 8 hours for "tune_8".'
+                    return handle_validation_errors(self, msg, 'tune_8_hours', date, line_no, order_code)
+            elif data['order_code'] == 'tune_48':
+                if prof:
+                    prof.enter('tune')
+                if data['product_code'] != 'tune_48':
+                    msg = header + 'Mismatched "order_code" and "product_code".'
+                    return handle_validation_errors(self, msg, 'product_mismatch', date, line_no, order_code)
+                if last_code == 'tune_8':
+                    msg = header + '"tune_8" cannot be followed by "tune_48".'
+                    return handle_validation_errors(self, msg, 'tune_sequence', date, line_no, order_code)
+                if data['hours'] > 24:
+                    msg = header + 'Invalid tune hours for "tune_48".'
+                    return handle_validation_errors(self, msg, 'tune_48_hours', date, line_no, order_code)
+                state.tune_hours += data['hours']
+                if state.tune_hours > 48:
+                    msg = header + 'You cannot tune more than 48 hours for "tune_48".'
+                    return handle_validation_errors(self, msg, 'tune_48_hours', date, line_no, order_code)
+        return self.check_pass, self.check_msg
 
+    def recover_item(self, run, state, line_no, data, tune_hours):
+        """Advance the line state past an item that failed a check, as if it had been scheduled.
+
+        Used in collect-all mode so the checks on the following items compare
+        against what the submission intended. Returns the hours the item adds
+        to its line-day.
+        """
+        if not isinstance(data, dict):
+            return 0
+        order_code = data.get('order_code')
+        hours = data.get('hours')
+        if not isinstance(hours, int):
+            hours = 0
+        if not isinstance(order_code, str):
+            return hours
+        state.last_code = order_code
+        row = self.orders.index.get(order_code)
+        if row is not None:
+            run.order_set.add(order_code)
+            run.amount_dict[order_code] = hours * 125 + run.amount_dict.get(order_code, 0)
+            run.open_line_per_day.add(line_no)
+            state.tune_hours = 0
+            state.last_type = self.orders.type[row]
+            if isinstance(data.get('mfg_width'), int):
+                state.last_mfg_width = data['mfg_width']
+            if self.orders.composition[row]:
+                state.last_composition = self.orders.composition[row]
+        elif order_code in tune_order_code:
+            run.open_line_per_day.add(line_no)
+            state.tune_hours = tune_hours + hours
+        return hours
+
+    def check_orders(self, run):
+        """10-11. Check the orders and quantities gathered over the whole schedule."""
+        if self.profile:
+            self.profile.enter('orders')
+        #  10. Check if all orders are included.
+        if run.order_set != set(self.orders.index):
+            msg = 'Not all order are included.'
+            handle_validation_errors(self, msg, 'order_missing')
+            if self.stop_checking():
+                return self.check_pass, self.check_msg
+
+        #  11. Check if the product amount is valid.
+        for order, amount in run.amount_dict.items():
+            if amount != self.orders.quantity[self.orders.index[order]]:
+                msg = 'Wrong production quantity for order: {}.'.format(order)
+                handle_validation_errors(self, msg, 'quantity', order_code=order)
+                if self.stop_checking():
+                    return self.check_pass, self.check_msg
         return self.check_pass, self.check_msg
 
 
+def schedule_from_records(records):
+    """Build the {date: {line: [items]}} layout from flat records.
+
+    Each record is ``(date, line_no, order_code, product_code, hours, mfg_width)``;
+    dates, lines and items keep the order they first appear in.
+    """
+    schedule = {}
+    for date, line_no, order_code, product_code, hours, mfg_width in records:
+        schedule.setdefault(date, {}).setdefault(line_no, []).append(
+            {'order_code': order_code, 'product_code': product_code, 'hours': hours, 'mfg_width': mfg_width})
+    return schedule
+
+
+def evaluate(orders, schedule, start_date, end_date, max_violations=1, profile=None, plant=None, vectorized=False):
+    """Validate an in-memory schedule, e.g. as the fitness function of an optimizer.
+
+    ``orders`` is a compiled OrderTable (or an order file path) and ``schedule``
+    is either the submission dict or a sequence of records accepted by
+    ``schedule_from_records``. Returns an Evaluation with the verdict, the
+    violations found (up to ``max_violations``, None for all) and the metrics
+    from ``new_metrics``. A RuleProfile passed as ``profile`` accumulates the
+    time spent in each rule group over all the calls it is given to.
+    With ``vectorized``, a valid schedule is proved valid by the column checks
+    of vector_check.py (NumPy) instead of item by item.
+    """
+    if not isinstance(schedule, Mapping):
+        schedule = schedule_from_records(schedule)
+    val = Validator(orders, schedule, start_date, end_date, max_violations, profile, plant)
+    val.validate_dates()
+    if vectorized:
+        from vector_check import check_valid_schedule_vectorized
+        check_valid_schedule_vectorized(val)
+    else:
+        val.check_valid_schedule()
+    return Evaluation(val.check_pass, val.check_msg, val.violations, val.metrics)
+
+
+def validate_file(order_file, submit_file, start_date, end_date, max_violations=1, cache=None, plant=None):
+    """Run every check on one submission file and return the verdict as a dict.
+
+    With a ResultCache, a submission validated before against the same order
+    file, dates and rules returns the stored verdict without being checked.
+    """
+    key = cache.key(order_file, submit_file, start_date, end_date, max_violations, plant) if cache else None
+    if key:
+        result = cache.get(key)
+        if result is not None:
+            return {'submit_file': submit_file, **result}
+    val = Validator(order_file, submit_file, start_date, end_date, max_violations, plant=plant)
+    val.validate_dates()
+    val.check_valid_schedule()
+    result = {'submit_file': submit_file, 'check_pass': val.check_pass, 'check_msg': val.check_msg,
+              'violations': [violation._asdict() for violation in val.violations]}
+    if key:
+        cache.put(key, result)
+    return result
+
+
+def list_submissions(pattern):
+    """Expand a directory or glob pattern into a sorted list of submission files."""
+    if os.path.isdir(pattern):
+        pattern = os.path.join(pattern, '*.json')
+    return sorted(glob.glob(pattern))
+
+
+_worker_orders = None
+_worker_plant = None
+
+
+def _init_batch_worker(orders, plant):
+    global _worker_orders, _worker_plant
+    from shared_order_table import attach_orders
+    _worker_orders = attach_orders(orders)
+    _worker_plant = plant
+
+
+def _validate_batch_item(submit_file, start_date, end_date, max_violations):
+    """Validate one batch file; an error raised while checking it fails that file only, as internal_error."""
+    try:
+        return validate_file(_worker_orders, submit_file, start_date, end_date, max_violations, plant=_worker_plant)
+    except Exception as e:
+        msg = 'Internal error while checking the submission: {}: {}'.format(type(e).__name__, e)
+        return {'submit_file': submit_file, 'check_pass': False, 'check_msg': msg,
+                'violations': [Violation('internal_error', msg, None, None, None)._asdict()]}
+
+
+def validate_batch(order_file, submit_files, start_date, end_date, workers=None, max_violations=1, cache=None,
+                   plant=None, shared_orders=False):
+    """Validate many submission files across a process pool.
+
+    The order file is read and compiled once; each worker receives the compiled
+    table when it starts instead of parsing the CSV again. With
+    ``shared_orders`` the table is written once to a memory-mapped file that
+    every worker attaches to (see shared_order_table.py) instead of receiving
+    its own copy. Results are yielded as soon as each file finishes, so their
+    order follows completion time. With a ResultCache, cached files are
+    yielded first without reaching the pool and new results are stored as
+    they arrive.
+    """
+    from concurrent.futures import ProcessPoolExecutor, as_completed
+    check_max_violations(max_violations)
+    try:
+        orders = OrderTable.from_csv(order_file)
+    except Exception as e:
+        for submit_file in submit_files:
+            yield {'submit_file': submit_file, 'check_pass': False, 'check_msg': str(e),
+                   'violations': [Violation('order_file', str(e), None, None, None)._asdict()]}
+        return
+
+    keys = {}
+    pending = []
+    for submit_file in submit_files:
+        key = cache.key(orders, submit_file, start_date, end_date, max_violations, plant) if cache else None
+        result = cache.get(key) if key else None
+        if result is not None:
+            yield {'submit_file': submit_file, **result}
+        else:
+            keys[submit_file] = key
+            pending.append(submit_file)
+    if not pending:
+        return
+
+    if shared_orders:
+        from shared_order_table import shared_order_file
+    with shared_order_file(orders) if shared_orders else nullcontext(orders) as worker_orders, \
+            ProcessPoolExecutor(workers, initializer=_init_batch_worker, initargs=(worker_orders, plant)) as pool:
+        futures = [pool.submit(_validate_batch_item, submit_file, start_date, end_date, max_violations)
+                   for submit_file in pending]
+        for future in as_completed(futures):
+            result = future.result()
+            if keys[result['submit_file']]:
+                cache.put(keys[result['submit_file']], result)
+            yield result
+
+
+class BatchReport:
+    """Append batch results to a JSONL or CSV report as they arrive."""
+
+    fields = ['submit_file', 'check_pass', 'check_msg', 'violations']
+
+    def __init__(self, report_file):
+        self.file = open(report_file, 'w', newline='')
+        self.writer = None
+        if os.path.splitext(report_file)[1].lower() == '.csv':
+            self.writer = csv.DictWriter(self.file, fieldnames=self.fields)
+            self.writer.writeheader()
+
+    def write(self, result):
+        if self.writer:
+            self.writer.writerow(dict(result, violations=json.dumps(result['violations'])))
+        else:
+            self.file.write(json.dumps(result) + '\n')
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
 if __name__ == '__main__':
     parser = argparse.ArgumentParser("validator")
     parser.add_argument("--order_file", default='orders_2019.csv', type=str)
     parser.add_argument("--submit_file", default='submission_example.json', type=str)
     parser.add_argument("--start_date", default='2019-07-01', type=str)
     parser.add_argument("--end_date", default='2019-12-31', type=str)
+    parser.add_argument("--batch", default=None, type=str, help="directory or glob of submission files")
+    parser.add_argument("--report", default='report.jsonl', type=str, help="batch report file (.jsonl or .csv)")
+    parser.add_argument("--workers", default=None, type=int, help="number of batch worker processes")
+    parser.add_argument("--max_violations", default=1, type=int,
+                        help="keep validating until this many violations are found (0 for no limit)")
+    parser.add_argument("--line_workers", default=0, type=int,
+                        help="check the production lines of the submission in this many worker processes")
+    parser.add_argument("--shared_orders", action='store_true',
+                        help="share one memory-mapped order table among the --batch or --line_workers processes")
+    parser.add_argument("--stream", action='store_true',
+                        help="parse and check the submission one day at a time")
+    parser.add_argument("--profile", default=None, type=str,
+                        help="write the call counts and time of each rule group to this JSON file")
+    parser.add_argument("--plant", default=None, type=str,
+                        help="plant model file (see plant_model.py); defaults to the plant in query_table.py")
+    parser.add_argument("--cache", default=None, type=str,
+                        help="directory of cached results; identical submissions are not checked again")
+    parser.add_argument("--cache_max_mb", default=256, type=int, help="evict cached results beyond this size")
+    parser.add_argument("--cache_max_days", default=30, type=int, help="evict cached results older than this")
+    parser.add_argument("--vectorized", action='store_true',
+                        help="prove a valid submission with column checks (NumPy) before checking item by item")
+    parser.add_argument("--prescreen", action='store_true',
+                        help="reject order books and submissions that cannot meet capacity before the full checks")
+    parser.add_argument("--timeline", default=None, type=str,
+                        help="write the item timeline of a valid submission to this .parquet, .feather or .csv file")
     args = parser.parse_args()
-    val = Validator(args.order_file, args.submit_file, args.start_date, args.end_date)
-    val.validate_dates()
-    val.check_valid_schedule()
-    print(val.check_msg)
+    if args.max_violations < 0:
+        parser.error('--max_violations should be 0 (no limit) or positive')
+    max_violations = args.max_violations or None
+    if args.profile and (args.batch or args.line_workers or args.stream):
+        parser.error('--profile cannot be combined with --batch, --line_workers or --stream')
+    if args.cache and (args.profile or args.line_workers or args.stream):
+        parser.error('--cache cannot be combined with --profile, --line_workers or --stream')
+    if args.vectorized and (args.batch or args.line_workers or args.stream or args.profile or args.cache):
+        parser.error('--vectorized cannot be combined with --batch, --line_workers, --stream, --profile or --cache')
+    if args.prescreen and (args.batch or args.line_workers or args.stream or args.cache):
+        parser.error('--prescreen cannot be combined with --batch, --line_workers, --stream or --cache')
+    if args.shared_orders and not (args.batch or args.line_workers):
+        parser.error('--shared_orders needs --batch or --line_workers')
+    if args.timeline and (args.batch or args.line_workers or args.stream or args.cache):
+        parser.error('--timeline cannot be combined with --batch, --line_workers, --stream or --cache')
+    if args.timeline:
+        from timeline_export import check_timeline_file
+        try:
+            check_timeline_file(args.timeline)
+        except (ValueError, ImportError) as e:
+            parser.error(str(e))
+    plant = PlantModel.load(args.plant) if args.plant else None
+    cache = None
+    if args.cache:
+        from result_cache import ResultCache
+        cache = ResultCache(args.cache, args.cache_max_mb << 20, args.cache_max_days * 24 * 3600)
+    if args.batch:
+        submit_files = list_submissions(args.batch)
+        with BatchReport(args.report) as report:
+            for result in validate_batch(args.order_file, submit_files, args.start_date, args.end_date, args.workers,
+                                         max_violations, cache, plant, args.shared_orders):
+                report.write(result)
+                print('{}: {}'.format(result['submit_file'], result['check_msg']))
+    else:
+        if cache:
+            result = validate_file(args.order_file, args.submit_file, args.start_date, args.end_date,
+                                   max_violations, cache, plant)
+            val = Evaluation(result['check_pass'], result['check_msg'],
+                             [Violation(**violation) for violation in result['violations']], None)
+        elif args.line_workers:
+            from line_parallel import LineParallelValidator
+            try:
+                orders = OrderTable.from_csv(args.order_file)
+            except Exception as e:
+                val = Evaluation(False, str(e), [Violation('order_file', str(e), None, None, None)], new_metrics())
+            else:
+                with LineParallelValidator(orders, args.line_workers, plant, args.shared_orders) as line_validator:
+                    val = line_validator.validate(args.submit_file, args.start_date, args.end_date, max_violations)
+        elif args.stream:
+            from schedule_stream import validate_stream
+            val = validate_stream(args.order_file, args.submit_file, args.start_date, args.end_date, max_violations,
+                                  plant=plant)
+        else:
+            profile = RuleProfile() if args.profile else None
+            val = Validator(args.order_file, args.submit_file, args.start_date, args.end_date, max_violations,
+                            profile, plant)
+            if args.prescreen:
+                from capacity_check import prescreen
+                prescreen(val)
+            if val.check_pass:
+                val.validate_dates()
+                if args.vectorized:
+                    from vector_check import check_valid_schedule_vectorized
+                    check_valid_schedule_vectorized(val)
+                else:
+                    val.check_valid_schedule()
+            if profile:
+                with open(args.profile, 'w') as f:
+                    json.dump(profile.summary(), f, indent=2)
+        if len(val.violations) > 1:
+            for violation in val.violations:
+                print('[{}] {}'.format(violation.rule, violation.msg))
+        else:
+            print(val.check_msg)
+        if args.timeline:
+            from timeline_export import export_timeline
+            if not export_timeline(val, args.timeline):
+                print('No timeline written: the submission is not valid.')
+    if cache:
+        print('Cache: {hits} hits, {misses} misses, {entries} entries ({bytes} bytes).'.format(**cache.stats()))
@@ -0,0 +1,262 @@
+#  Copyright (c) 2020 Industrial Technology Research Institute.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+import numpy as np
+from query_table import special_order_code
+from schedule_binary import schedule_to_arrays
+from validator import new_metrics
+
+STOP, TUNE_8, TUNE_48, ORDER, INVALID = 0, 1, 2, 3, -1
+
+
+def _columns(data):
+    """(dates, lines, codes, line_days, items) of a schedule, or None if it cannot be put in columns."""
+    if hasattr(data, 'item_table'):
+        return data.dates, data.lines, data.codes, data.line_day_table, data.item_table
+    try:
+        return schedule_to_arrays(data)
+    except ValueError:
+        return None
+
+
+def _scan_line(kinds, rows, hours, mfg_widths, last_type, orders):
+    """8. Tune transitions of one line, in schedule order; the only sequential part of the checks."""
+    types = orders.type
+    compositions = orders.composition
+    last_kind = None
+    last_composition = None
+    last_mfg_width = None
+    tune_hours = 0
+    for kind, row, hour, mfg_width in zip(kinds, rows, hours, mfg_widths):
+        if kind == ORDER:
+            if last_kind is None or last_kind == STOP:
+                return False
+            prev_tune_hours = tune_hours
+            tune_hours = 0
+            product_type = types[row]
+            type_change = bool(last_type) and last_type != product_type
+            if type_change and (last_kind != TUNE_48 or prev_tune_hours != 48):
+                return False
+            valid_tune = (TUNE_48, 48) if type_change else (TUNE_8, 8)
+            composition = compositions[row]
+            if last_composition and last_composition != '0%' and composition and composition == '0%':
+                if (last_kind, prev_tune_hours) != valid_tune:
+                    return False
+            if last_mfg_width is not None and mfg_width != last_mfg_width:
+                if (last_kind, prev_tune_hours) != valid_tune:
+                    return False
+            last_mfg_width = mfg_width
+            if composition:
+                last_composition = composition
+            last_type = product_type
+        elif kind == TUNE_8:
+            if last_kind == TUNE_48:
+                return False
+            tune_hours += hour
+            if tune_hours > 8:
+                return False
+        elif kind == TUNE_48:
+            if last_kind == TUNE_8:
+                return False
+            tune_hours += hour
+            if tune_hours > 48:
+                return False
+        last_kind = kind
+    return True
+
+
+def prove_valid(val):
+    """Run checks 3-11 on the schedule of a Validator as column operations.
+
+    The schedule is flattened into one row per item (a BinarySchedule already
+    is). Every stateless rule (keys and types, codes, hours, mfg_width, date
+    windows, MS and K lines, width limits and margins, 24 hours per line-day,
+    line coverage, open-line count, order completeness and quantities) is
+    evaluated for all items at once against per-code lookup arrays built from
+    the order table and plant. Only the tune transitions are scanned item by
+    item, one line at a time, on plain integers.
+
+    Returns the metrics if every check passes and None otherwise. The result
+    is the same as ``check_valid_schedule`` on a valid schedule; an invalid
+    one is not described here and has to be checked sequentially to get its
+    violations in order.
+    """
+    plant = val.plant
+    orders = val.orders
+    columns = _columns(val.data)
+    if columns is None or any(code in orders.index for code in special_order_code):
+        return None
+    dates, lines, codes, line_days, items = columns
+    n_lines = len(plant.lines)
+
+    #  3, 9. Line names, non-empty items and every line of the plant on every day.
+    if any(line_no not in plant.line_bit for line_no in lines):
+        return None
+    line_id = np.array([plant.lines.index(line_no) for line_no in lines] or [0], dtype=np.int64)
+    ld_line = line_id[line_days['line']]
+    ld_key = line_days['day'].astype(np.int64) * n_lines + ld_line
+    if len(line_days) != len(dates) * n_lines or len(np.unique(ld_key)) != len(line_days):
+        return None
+    if len(items) == 0 or (line_days['count'] == 0).any():
+        return None
+    starts = line_days['start']
+
+    #  4. Order and product codes, hours and mfg_width.
+    code_row = np.array([orders.index.get(code, -1) for code in codes], dtype=np.int64)
+    code_kind = np.array([{'stop': STOP, 'tune_8': TUNE_8, 'tune_48': TUNE_48}.get(code, ORDER if row >= 0 else INVALID)
+                          for code, row in zip(codes, code_row.tolist())], dtype=np.int64)
+    code_is_product = np.array([code in plant.product_lines or code in special_order_code for code in codes])
+    order_code = items['order_code']
+    product_code = items['product_code']
+    hours = items['hours']
+    mfg_width = items['mfg_width']
+    kind = code_kind[order_code]
+    if (kind == INVALID).any() or not code_is_product[product_code].all():
+        return None
+    # No valid line-day has an item over 24 hours, and this keeps the int64 sums below from wrapping.
+    if (hours < 0).any() or (hours > 24).any() or (mfg_width < 0).any():
+        return None
+
+    #  8. Tune items: product code and hours of a single item.
+    code_index = {code: i for i, code in enumerate(codes)}
+    tune_8 = kind == TUNE_8
+    tune_48 = kind == TUNE_48
+    if (product_code[tune_8] != code_index.get('tune_8', -1)).any() or (hours[tune_8] > 8).any():
+        return None
+    if (product_code[tune_48] != code_index.get('tune_48', -1)).any() or (hours[tune_48] > 24).any():
+        return None
+
+    # Per-code lookup arrays of the order table; codes that are not orders get placeholders.
+    order_rows = code_row.tolist()
+    if any(row in orders.date_errors for row in order_rows if row >= 0):
+        return None
+    widths = [orders.width[row] for row in order_rows if row >= 0]
+    if not all(isinstance(width, (int, float)) and not isinstance(width, bool) for width in widths):
+        return None
+    types = sorted({product_type for (_, product_type) in plant.width_limits})
+    type_id = {product_type: i for i, product_type in enumerate(types)}
+    materials = list(plant.material_lines)
+    material_id = {material: i for i, material in enumerate(materials)}
+
+    def per_code(value, default):
+        return [value(row) if row >= 0 else default for row in order_rows]
+
+    code_product = np.array(per_code(lambda row: code_index.get(orders.product_code[row], -1), -1), dtype=np.int64)
+    code_not_before = np.array(per_code(lambda row: orders.not_before[row], 0), dtype=np.int64)
+    code_not_after = np.array(per_code(lambda row: orders.not_after[row], 0), dtype=np.int64)
+    code_material = np.array(per_code(lambda row: material_id.get(orders.material[row], len(materials)), 0),
+                             dtype=np.int64)
+    code_type = np.array(per_code(lambda row: type_id.get(orders.type[row], -1), 0), dtype=np.int64)
+    code_width = np.array(per_code(lambda row: orders.width[row], 0), dtype=np.float64)
+
+    item_ld = np.repeat(np.arange(len(line_days)), line_days['count'])
+    item_line = ld_line[item_ld]
+    is_order = kind == ORDER
+    o_code = order_code[is_order]
+    o_line = item_line[is_order]
+    o_mfg = mfg_width[is_order]
+
+    #  5. Product code of the order and its date window.
+    if (code_product[o_code] != product_code[is_order]).any():
+        return None
+    try:
+        day_ordinal = np.array([val.calendar.ordinal(date) for date in dates], dtype=np.int64)
+    except ValueError:
+        return None
+    o_day = day_ordinal[line_days['day'][item_ld[is_order]]]
+    if ((o_day < code_not_before[o_code]) | (o_day > code_not_after[o_code])).any():
+        return None
+
+    #  6. Lines allowed for the material and the product.
+    material_allowed = np.ones((len(materials) + 1, n_lines), dtype=bool)
+    for material, mask in plant.material_lines.items():
+        material_allowed[material_id[material]] = [bool(mask >> bit & 1) for bit in range(n_lines)]
+    if not material_allowed[code_material[o_code], o_line].all():
+        return None
+    product_allowed = np.ones((len(codes), n_lines), dtype=bool)
+    for i, code in enumerate(codes):
+        mask = plant.product_lines.get(code)
+        if mask is not None and mask != plant.all_lines:
+            product_allowed[i] = [bool(mask >> bit & 1) for bit in range(n_lines)]
+    if not product_allowed[product_code[is_order], o_line].all():
+        return None
+
+    #  7. Width limits of the line and type, and the margin of the type.
+    max_mfg_width = np.zeros((n_lines, len(types) or 1), dtype=np.int64)
+    max_width = np.zeros((n_lines, len(types) or 1), dtype=np.float64)
+    for (line_no, product_type), (line_max_mfg, line_max) in plant.width_limits.items():
+        max_mfg_width[plant.lines.index(line_no), type_id[product_type]] = line_max_mfg
+        max_width[plant.lines.index(line_no), type_id[product_type]] = line_max
+    margin = np.array([plant.width_margin.get(product_type, np.nan) for product_type in types] or [np.nan])
+    o_type = code_type[o_code]
+    if (o_type < 0).any():
+        return None
+    o_width = code_width[o_code]
+    if (max_mfg_width[o_line, o_type] == 0).any() or (o_mfg > max_mfg_width[o_line, o_type]).any():
+        return None
+    if (o_width > max_width[o_line, o_type]).any() or ((o_mfg - o_width) < margin[o_type]).any():
+        return None
+
+    #  3, 9. 24 hours per line-day and the number of open lines per day.
+    if (np.add.reduceat(hours, starts) != 24).any():
+        return None
+    line_open = np.maximum.reduceat((kind != STOP).astype(np.int64), starts)
+    open_count = np.bincount(line_days['day'], weights=line_open, minlength=len(dates)).astype(np.int64)
+    if not np.isin(open_count, list(plant.open_lines)).all():
+        return None
+
+    #  10-11. Every order scheduled with hours * 125 == quantity.
+    o_row = code_row[o_code]
+    amounts = np.zeros(len(orders.codes), dtype=np.int64)
+    np.add.at(amounts, o_row, hours[is_order] * 125)
+    scheduled = np.zeros(len(orders.codes), dtype=bool)
+    scheduled[o_row] = True
+    amounts = amounts.tolist()
+    for row in orders.index.values():
+        if not scheduled[row] or amounts[row] != orders.quantity[row]:
+            return None
+
+    #  8. Tune transitions, line by line.
+    order = np.argsort(item_line, kind='stable')
+    bounds = np.searchsorted(item_line[order], np.arange(n_lines + 1)).tolist()
+    item_kind = kind[order].tolist()
+    item_row = code_row[order_code[order]].tolist()
+    item_hours = hours[order].tolist()
+    item_mfg_width = mfg_width[order].tolist()
+    for line, line_no in enumerate(plant.lines):
+        a, b = bounds[line], bounds[line + 1]
+        if not _scan_line(item_kind[a:b], item_row[a:b], item_hours[a:b], item_mfg_width[a:b],
+                          plant.initial_state[line_no], orders):
+            return None
+
+    metrics = new_metrics()
+    metrics['tune_8_hours'] = int(hours[tune_8].sum())
+    metrics['tune_48_hours'] = int(hours[tune_48].sum())
+    metrics['stop_hours'] = int(hours[kind == STOP].sum())
+    metrics['open_line_days'] = int(line_open.sum())
+    return metrics
+
+
+def check_valid_schedule_vectorized(val):
+    """Drop-in for ``val.check_valid_schedule()`` that tries the column checks first.
+
+    A schedule the column checks prove valid is accepted with its metrics;
+    otherwise the sequential checks run to find and report the violations.
+    """
+    if val.can_check() and val.check_pass:
+        metrics = prove_valid(val)
+        if metrics is not None:
+            val.metrics = metrics
+            return val.check_pass, val.check_msg
+    return val.check_valid_schedule()
@@ -0,0 +1,168 @@
+#  Copyright (c) 2020 Industrial Technology Research Institute.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+import csv
+import datetime
+import json
+import random
+import argparse
+from query_table import valid_prod_no, valid_prod_line, valid_k_line, valid_ms_line, width_constraint, width_margin, \
+    initial_state
+
+order_fields = ['order_code', 'product_code', 'material', 'composition', 'type', 'width', 'quantity',
+                'not_before', 'not_after']
+materials = ['PS', 'PMMA', 'MS']
+compositions = ['0%', '8%', '100%']
+tune_hours = {'tune_8': 8, 'tune_48': 48}
+
+
+def _random_order(rng, line_no):
+    """Pick product, material, type and widths that line_no is allowed to produce."""
+    product_type = rng.choice(sorted(width_constraint[line_no]['max_mfg_width']))
+    margin = width_margin[product_type]
+    max_mfg_width = width_constraint[line_no]['max_mfg_width'][product_type]
+    max_width = min(width_constraint[line_no]['max_width'][product_type], max_mfg_width - margin)
+    width = rng.randrange(800, max_width + 1, 5)
+    mfg_width = min(width + margin + rng.choice([0, 0, 10]), max_mfg_width)
+
+    k_products = [code for code in valid_prod_no if 'K' in code]
+    n_products = [code for code in valid_prod_no if 'K' not in code]
+    if line_no in valid_k_line and rng.random() < 0.3:
+        product_code = rng.choice(k_products)
+    else:
+        product_code = rng.choice(n_products)
+    if line_no in valid_ms_line:
+        material = rng.choice(materials)
+    else:
+        material = rng.choice([material for material in materials if material != 'MS'])
+    return {'product_code': product_code, 'material': material, 'composition': rng.choice(compositions),
+            'type': product_type, 'width': width}, mfg_width
+
+
+def generate_workload(n_orders, n_days, n_lines=4, start_date='2019-07-01', seed=0, random_hours=False,
+                      shuffle_lines=False):
+    """Generate an order book and a schedule that passes every validator check.
+
+    ``n_lines`` production lines (2-6, so the daily open-line count holds) run
+    for the whole horizon of ``n_days`` days and share ``n_orders`` orders.
+    Every order gets its own line, type and widths within ``width_constraint``
+    and the ``valid_k_line`` and ``valid_ms_line`` restrictions, and is
+    preceded by tune_48 when the type changes or tune_8 otherwise, which
+    satisfies every tune rule. The orders of a line split its hours evenly,
+    or at random cut points (at least one hour each) with ``random_hours``;
+    with ``shuffle_lines`` the lines of every day are listed in random order.
+    Returns ``(orders, schedule, start_date, end_date)`` where ``orders`` is a
+    list of rows with the columns of orders_2019.csv.
+    """
+    if n_lines not in range(2, 7):
+        raise ValueError('n_lines should be between 2 and 6.')
+    if n_orders < n_lines:
+        raise ValueError('n_orders should be at least n_lines.')
+    rng = random.Random(seed)
+    start = datetime.datetime.strptime(start_date, '%Y-%m-%d').date()
+    dates = [(start + datetime.timedelta(n)).strftime('%Y-%m-%d') for n in range(n_days)]
+    capacity = n_days * 24
+    lines = rng.sample(valid_prod_line, n_lines)
+    line_orders = [n_orders // n_lines + (i < n_orders % n_lines) for i in range(n_lines)]
+    if capacity // max(line_orders) < 50:
+        raise ValueError('Not enough days to produce {} orders on {} lines.'.format(n_orders, n_lines))
+
+    # Lay out every line as one timeline of (order_code, product_code, hours, mfg_width) blocks.
+    orders = []
+    timelines = {line_no: [('stop', 'stop', capacity, 0)] for line_no in valid_prod_line}
+    spans = {}
+    for line_no, count in zip(lines, line_orders):
+        picked = []
+        last_type = initial_state[line_no]
+        for _ in range(count):
+            order, mfg_width = _random_order(rng, line_no)
+            tune = 'tune_48' if order['type'] != last_type else 'tune_8'
+            picked.append((order, mfg_width, tune))
+            last_type = order['type']
+        if random_hours:
+            free = capacity - sum(tune_hours[tune] for _, _, tune in picked)
+            cuts = [0] + sorted(rng.sample(range(1, free), count - 1)) + [free]
+            order_hours = [cuts[i + 1] - cuts[i] for i in range(count)]
+        else:
+            slot = capacity // count
+            order_hours = [(slot if i < count - 1 else capacity - slot * (count - 1)) - tune_hours[tune]
+                           for i, (_, _, tune) in enumerate(picked)]
+        blocks = []
+        for (order, mfg_width, tune), hours in zip(picked, order_hours):
+            order['order_code'] = 'O{:06d}'.format(len(orders) + 1)
+            order['quantity'] = hours * 125
+            blocks.append((tune, tune, tune_hours[tune], 0))
+            blocks.append((order['order_code'], order['product_code'], hours, mfg_width))
+            orders.append(order)
+        timelines[line_no] = blocks
+
+    # Cut the timelines into days.
+    schedule = {date: {} for date in dates}
+    for line_no in valid_prod_line:
+        hour = 0
+        for order_code, product_code, hours, mfg_width in timelines[line_no]:
+            while hours:
+                day = hour // 24
+                part = min(hours, 24 - hour % 24)
+                schedule[dates[day]].setdefault(line_no, []).append(
+                    {'order_code': order_code, 'product_code': product_code, 'hours': part, 'mfg_width': mfg_width})
+                if order_code in spans:
+                    spans[order_code][1] = day
+                else:
+                    spans[order_code] = [day, day]
+                hour += part
+                hours -= part
+
+    for order in orders:
+        first_day, last_day = spans[order['order_code']]
+        not_before = start + datetime.timedelta(max(0, first_day - rng.randint(0, 5)))
+        not_after = start + datetime.timedelta(last_day + rng.randint(0, 5))
+        order['not_before'] = not_before.strftime('%Y-%m-%dT00:00:00')
+        order['not_after'] = not_after.strftime('%Y-%m-%dT00:00:00')
+    if shuffle_lines:
+        for date in dates:
+            line_nos = list(schedule[date])
+            rng.shuffle(line_nos)
+            schedule[date] = {line_no: schedule[date][line_no] for line_no in line_nos}
+    return orders, schedule, dates[0], dates[-1]
+
+
+def write_orders(orders, order_file):
+    """Write generated orders in the layout of orders_2019.csv."""
+    with open(order_file, 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=order_fields)
+        writer.writeheader()
+        writer.writerows(orders)
+
+
+def write_schedule(schedule, json_file):
+    with open(json_file, 'w') as f:
+        json.dump(schedule, f)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser("workload")
+    parser.add_argument("--orders", default=100, type=int, help="number of orders")
+    parser.add_argument("--days", default=184, type=int, help="number of days in the horizon")
+    parser.add_argument("--lines", default=4, type=int, help="number of producing lines (2-6)")
+    parser.add_argument("--start_date", default='2019-07-01', type=str)
+    parser.add_argument("--seed", default=0, type=int)
+    parser.add_argument("--order_file", default='orders_synthetic.csv', type=str)
+    parser.add_argument("--submit_file", default='submission_synthetic.json', type=str)
+    args = parser.parse_args()
+    orders, schedule, start_date, end_date = generate_workload(args.orders, args.days, args.lines,
+                                                               args.start_date, args.seed)
+    write_orders(orders, args.order_file)
+    write_schedule(schedule, args.submit_file)
+    print('{} orders from {} to {}.'.format(len(orders), start_date, end_date))